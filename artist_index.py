@@ -0,0 +1,164 @@
+import heapq
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace ("Beyoncé!" → "beyonce")."""
+    s = unicodedata.normalize("NFKD", name.lower())
+    s = "".join(c if c.isalnum() else " " for c in s if not unicodedata.combining(c))
+    return " ".join(s.split())
+
+
+def _trigrams(norm: str) -> set[str]:
+    s = f"  {norm} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class ArtistIndex:
+    """
+    In-memory trigram index of canonical artist names.
+
+    lookup() returns a canonical name only when it is confident: an exact
+    match after normalization, or a fuzzy match whose Dice score on padded
+    trigrams is at least `min_score` and beats the runner-up by `margin`.
+    A fuzzy match must also have as many words as the query and must not
+    be a prefix of it or extend it ("drake" is not "Drake Bell", "queens" is
+    not "Queen"): those are different names, not typos. Anything else
+    returns None and the caller should ask Last.fm.
+
+    At most `max_names` names are kept; adding past that drops the least
+    recently added or matched one. Fuzzy lookups collect candidates from the
+    query's rarest trigrams, reading at most `max_postings` ids, and fully
+    score only the `rescore` best of those, so a lookup costs about the
+    same however big the index gets. A query made only of very common
+    trigrams then misses and goes to Last.fm.
+    """
+
+    def __init__(self, min_score: float = 0.7, margin: float = 0.05,
+                 max_names: int = 100_000, max_postings: int = 2000, rescore: int = 32):
+        self.min_score = min_score
+        self.margin = margin
+        self.max_names = max_names
+        self.max_postings = max_postings
+        self.rescore = rescore
+        self._entries: OrderedDict[int, tuple[str, str, int]] = OrderedDict()  # id -> (name, norm, trigrams), LRU order
+        self._by_norm: dict[str, int] = {}
+        self._postings: dict[str, set[int]] = defaultdict(set)
+        self._next_id = 0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.too_common = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, name: str | None):
+        if not name:
+            return
+        norm = normalize_name(name)
+        if not norm:
+            return
+        idx = self._by_norm.get(norm)
+        if idx is not None:
+            self._entries.move_to_end(idx)
+            return
+        idx = self._next_id
+        self._next_id += 1
+        grams = _trigrams(norm)
+        self._entries[idx] = (name, norm, len(grams))
+        self._by_norm[norm] = idx
+        for g in grams:
+            self._postings[g].add(idx)
+        while len(self._entries) > self.max_names:
+            self._evict()
+
+    def _evict(self):
+        idx, (_, norm, _) = self._entries.popitem(last=False)
+        del self._by_norm[norm]
+        for g in _trigrams(norm):
+            ids = self._postings[g]
+            ids.discard(idx)
+            if not ids:
+                del self._postings[g]
+        self.evictions += 1
+
+    def add_many(self, names):
+        for n in names:
+            self.add(n)
+
+    def load(self, path: str) -> int:
+        """Seed from a text file with one artist name per line; returns the number of names read."""
+        count = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                self.add(line.strip())
+                count += 1
+        return count
+
+    def lookup(self, query: str | None) -> str | None:
+        norm = normalize_name(query or "")
+        if not norm:
+            return None
+        idx = self._by_norm.get(norm)
+        if idx is not None:
+            self.exact_hits += 1
+            self._entries.move_to_end(idx)
+            return self._entries[idx][0]
+
+        # candidates come from the rarest trigrams, scanning at most max_postings ids; the
+        # names sharing the most of those get their full overlap counted and scored
+        grams = sorted(_trigrams(norm), key=lambda g: len(self._postings.get(g, ())))
+        shared: dict[int, int] = defaultdict(int)
+        budget = self.max_postings
+        used = 0
+        for used, g in enumerate(grams):
+            ids = self._postings.get(g, ())
+            if len(ids) > budget:
+                break
+            budget -= len(ids)
+            for i in ids:
+                shared[i] += 1
+        else:
+            used = len(grams)
+        if not used and self._postings.get(grams[0]):
+            self.too_common += 1
+        if used < len(grams) and shared:
+            top = heapq.nlargest(self.rescore, shared, key=shared.__getitem__)
+            shared = {i: shared[i] for i in top}
+            for g in grams[used:]:
+                ids = self._postings.get(g)
+                if ids:
+                    for i in shared:
+                        if i in ids:
+                            shared[i] += 1
+        best = second = 0.0
+        best_idx = -1
+        words = norm.count(" ")
+        for i, n in shared.items():
+            _, cand, cand_grams = self._entries[i]
+            if cand.count(" ") != words or cand.startswith(norm) or norm.startswith(cand):
+                continue
+            score = 2 * n / (len(grams) + cand_grams)
+            if score > best:
+                best, second, best_idx = score, best, i
+            elif score > second:
+                second = score
+        if best >= self.min_score and best - second >= self.margin:
+            self.fuzzy_hits += 1
+            self._entries.move_to_end(best_idx)
+            return self._entries[best_idx][0]
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "names": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "too_common": self.too_common,
+        }
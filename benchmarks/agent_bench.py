@@ -0,0 +1,183 @@
+"""
+End-to-end agent benchmark against a local fake Last.fm (no key, no network).
+
+Drives lastfm.get_tracks_for_intent and MusicAgent.assist (through the
+embedded in-memory response handler) with prompts for every intent at
+several concurrency levels, and reports per-intent p50/p95/p99 latency,
+throughput and upstream calls per request. Each level starts from a cold
+cache unless --warm is given.
+
+    python -m benchmarks.agent_bench
+    python -m benchmarks.agent_bench --concurrency 1,16,64 --requests 400 --latency 0.1 --error-rate 0.05
+    python -m benchmarks.agent_bench --target assist --stall-rate 0.02 --no-hedge --budget 0   # tail without the defences
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+os.environ["LASTFM_API_KEY"] = "offline-bench"  # before lastfm / music_agent read it
+
+import lastfm
+import music_agent
+from metrics import BUDGET_TIMEOUTS, FALLBACKS, LASTFM_HEDGES
+from artist_index import ArtistIndex
+from embedded import InMemoryResponseHandler
+from music_agent import MusicAgent
+from parser import parse_prompt
+from ratelimit import TokenBucket
+
+from benchmarks.fake_lastfm import FakeLastFM
+
+
+def prompts(n: int, seed: int = 5) -> list[str]:
+    """A mixed workload: repeats of popular prompts plus a long tail, across all intents."""
+    rng = random.Random(seed)
+    makers = [
+        lambda: rng.choice(["i am sad", "workout", "chill", "need to focus", "happy", "angry"]),        # mood
+        lambda: rng.choice(["jazz", "lofi beats", "k-pop", "bluegrass"]) if rng.random() < 0.5
+        else f"tag {rng.randrange(200)}",                                                              # vibe
+        lambda: f"Artist {rng.randrange(500)} - Title {rng.randrange(50)}",                             # track
+        lambda: f"something for a long drive number {rng.randrange(300)}",                              # track search
+        lambda: f"like Artist {rng.randrange(100)}",                                                    # artist_like
+        lambda: f"top tracks by Artist {rng.randrange(100)}",                                           # artist_top
+    ]
+    return [rng.choice(makers)() for _ in range(n)]
+
+
+def reset_lastfm(fake: FakeLastFM, rps: float, burst: int, cold: bool):
+    if cold:
+        lastfm._cache.clear()
+        lastfm._artist_index = ArtistIndex()
+    lastfm._limiter = TokenBucket(rps, burst)
+    fake.reset()
+
+
+async def via_intent(prompt: str, conv: str) -> float | None:
+    await lastfm.get_tracks_for_intent(parse_prompt(prompt), limit=5)
+    return None
+
+
+def via_assist(agent: MusicAgent):
+    async def run(prompt: str, conv: str) -> float | None:
+        started = time.perf_counter()
+        first = []
+
+        def dispatch(name, content):
+            if name == "FINAL_RESPONSE" and not first:
+                first.append(time.perf_counter() - started)
+
+        await agent.assist(SimpleNamespace(activity_id=conv, conversation_id=conv),
+                           SimpleNamespace(id=conv, prompt=prompt), InMemoryResponseHandler(dispatch))
+        return first[0] if first else None
+    return run
+
+
+def _pct(values: list[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else float("nan")
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def run_level(fn, workload: list[str], concurrency: int) -> tuple[dict, list[float], float, dict]:
+    sem = asyncio.Semaphore(concurrency)
+    by_intent: dict[str, list[float]] = defaultdict(list)
+    first_chunk: list[float] = []
+
+    async def one(i: int, prompt: str):
+        async with sem:
+            started = time.perf_counter()
+            ttft = await fn(prompt, f"bench-{i}")
+            by_intent[parse_prompt(prompt).intent].append(time.perf_counter() - started)
+            if ttft is not None:
+                first_chunk.append(ttft)
+
+    def counts():
+        return {**lastfm._cache.stats(), "retries": lastfm._retries, "gave_up": lastfm._gave_up,
+                "hedges": sum(v for k, v in LASTFM_HEDGES.snapshot().items() if k[1] == "sent"),
+                "hedges_won": sum(v for k, v in LASTFM_HEDGES.snapshot().items() if k[1] == "won"),
+                "budget_timeouts": sum(BUDGET_TIMEOUTS.snapshot().values()),
+                "fallbacks": sum(FALLBACKS.snapshot().values())}
+
+    before = counts()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i, p) for i, p in enumerate(workload)))
+    rate = len(workload) / (time.perf_counter() - started)
+    after = counts()
+    return by_intent, first_chunk, rate, {k: after[k] - before[k] for k in before if k not in ("entries", "bytes")}
+
+
+def report(label: str, concurrency: int, by_intent: dict, first_chunk: list[float], rate: float, counts: dict,
+           fake: FakeLastFM, n: int):
+    print(f"\n{label}, concurrency {concurrency}: {rate:,.1f} req/s")
+    print(f"  {'intent':<12}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    everything = []
+    for intent, lat in sorted(by_intent.items()):
+        everything += lat
+        print(f"  {intent:<12}{len(lat):>5}{_pct(lat, 50) * 1e3:>10.1f}{_pct(lat, 95) * 1e3:>10.1f}{_pct(lat, 99) * 1e3:>10.1f}")
+    print(f"  {'all':<12}{len(everything):>5}{_pct(everything, 50) * 1e3:>10.1f}"
+          f"{_pct(everything, 95) * 1e3:>10.1f}{_pct(everything, 99) * 1e3:>10.1f}")
+    if first_chunk:
+        print(f"  first track   p50 {_pct(first_chunk, 50) * 1e3:.1f} ms  p95 {_pct(first_chunk, 95) * 1e3:.1f} ms"
+              f"  p99 {_pct(first_chunk, 99) * 1e3:.1f} ms")
+    calls = sum(fake.calls.values())
+    per_method = ", ".join(f"{m} {c}" for m, c in fake.calls.most_common())
+    print(f"  upstream: {calls} calls ({calls / n:.2f}/req; {per_method})")
+    print(f"  {fake.errors} injected errors, {counts['retries']} retries, {counts['gave_up']} gave up; "
+          f"cache hits {counts['hits']} / misses {counts['misses']}")
+    print(f"  {counts['hedges']} hedges sent ({counts['hedges_won']} won), {counts['budget_timeouts']} budget timeouts, "
+          f"{counts['fallbacks']} fallback replies")
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=300, help="requests per concurrency level")
+    ap.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    ap.add_argument("--latency", type=float, default=0.08, help="fake Last.fm base latency (s)")
+    ap.add_argument("--jitter", type=float, default=0.03, help="mean of the exponential latency tail (s)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    ap.add_argument("--stall-rate", type=float, default=0.0, help="fraction of upstream calls that stall")
+    ap.add_argument("--stall", type=float, default=5.0, help="extra seconds a stalled call takes")
+    ap.add_argument("--budget", type=float, default=music_agent.ASSIST_BUDGET, help="assist latency budget (0 = none)")
+    ap.add_argument("--no-hedge", action="store_true", help="turn hedged Last.fm requests off")
+    ap.add_argument("--rps", type=float, default=0, help="Last.fm rate limit to apply (0 = off)")
+    ap.add_argument("--burst", type=int, default=10)
+    ap.add_argument("--target", choices=("intent", "assist", "both"), default="both")
+    ap.add_argument("--warm", action="store_true", help="run each level once unmeasured first")
+    args = ap.parse_args()
+
+    fake = FakeLastFM(args.latency, args.jitter, args.error_rate, stall_rate=args.stall_rate, stall=args.stall)
+    music_agent.ASSIST_BUDGET = args.budget
+    lastfm.LASTFM_HEDGE = not args.no_hedge
+    await lastfm.startup(transport=fake.transport())
+    agent = MusicAgent()
+    targets = []
+    if args.target in ("intent", "both"):
+        targets.append(("get_tracks_for_intent", via_intent))
+    if args.target in ("assist", "both"):
+        targets.append(("MusicAgent.assist", via_assist(agent)))
+
+    workload = prompts(args.requests)
+    print(f"{args.requests} requests/level, fake Last.fm {args.latency * 1e3:.0f} ms + ~{args.jitter * 1e3:.0f} ms tail, "
+          f"{args.error_rate:.0%} errors, {args.stall_rate:.0%} stalls of {args.stall:g}s, "
+          f"limiter {'off' if args.rps <= 0 else f'{args.rps}/s'}, budget {args.budget:g}s, "
+          f"hedging {'off' if args.no_hedge else 'on'}")
+    try:
+        for label, fn in targets:
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                reset_lastfm(fake, args.rps, args.burst, cold=True)
+                if args.warm:
+                    await run_level(fn, workload, concurrency)
+                    reset_lastfm(fake, args.rps, args.burst, cold=False)
+                by_intent, first_chunk, rate, counts = await run_level(fn, workload, concurrency)
+                report(label, concurrency, by_intent, first_chunk, rate, counts, fake, len(workload))
+    finally:
+        await lastfm.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
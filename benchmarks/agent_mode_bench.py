@@ -0,0 +1,103 @@
+"""
+Per-message overhead of the bot's two agent modes.
+
+Starts music_agent.py as a subprocess (with LASTFM_API_KEY empty, so the
+agent answers from its fallback list and no Last.fm time is measured) and
+sends the same prompts through bot.ask_agent over HTTP/SSE and through the
+embedded in-process agent. Reports per-message latency (mean/p50/p95),
+messages per second at a given concurrency, and checks both modes give the
+same result. Needs the agent's and the bot's dependencies.
+
+    python -m benchmarks.agent_mode_bench [n_messages] [concurrency]
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ["LASTFM_API_KEY"] = ""  # before anything imports lastfm / loads .env over it
+
+import httpx
+
+import bot
+
+PROMPTS = ["workout", "chill", "i am sad", "like drake", "top tracks by adele", "tarkan - şımarık", "rainy sunday"]
+SERVER_URL = "http://127.0.0.1:8000/assist"
+
+
+async def _wait_for_server(proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError("agent server exited during startup")
+            try:
+                await client.get(SERVER_URL.rsplit("/", 1)[0] + "/docs")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("agent server did not come up")
+
+
+async def _run(n: int, concurrency: int) -> tuple[list[float], float, list[dict]]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, results = [], []
+
+    async def one(i: int):
+        async with sem:
+            start = time.perf_counter()
+            result = await bot.ask_agent(PROMPTS[i % len(PROMPTS)], user_id="bench", conversation_id=f"bench-{i}")
+            latencies.append(time.perf_counter() - start)
+            results.append(result)
+
+    for i in range(min(20, n)):  # warm up pools / imports
+        await one(i)
+    latencies.clear()
+    results.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return latencies, n / (time.perf_counter() - start), results
+
+
+def _report(label: str, latencies: list[float], rate: float):
+    qs = statistics.quantiles(latencies, n=100)
+    print(f"{label:<9} mean {statistics.fmean(latencies) * 1e3:7.2f} ms  p50 {qs[49] * 1e3:7.2f} ms  "
+          f"p95 {qs[94] * 1e3:7.2f} ms  {rate:>8,.0f} msg/s")
+
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    print(f"{n} messages, concurrency {concurrency}")
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen([sys.executable, "music_agent.py"], cwd=root,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await _wait_for_server(proc)
+        bot.AGENT_MODE, bot.AGENT_URL = "http", SERVER_URL
+        http_lat, http_rate, http_results = await _run(n, concurrency)
+        await bot.close_agent_client()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    bot.AGENT_MODE = "embedded"
+    await bot.start_embedded_agent()
+    try:
+        emb_lat, emb_rate, emb_results = await _run(n, concurrency)
+    finally:
+        await bot.close_embedded_agent()
+
+    key = lambda r: (r["plan_text"], [(l["artist"], l["title"]) for l in r["links"]], r["final_text"])  # noqa: E731
+    assert sorted(map(key, http_results)) == sorted(map(key, emb_results)), "modes disagree"
+    _report("http", http_lat, http_rate)
+    _report("embedded", emb_lat, emb_rate)
+    print(f"embedded saves {(statistics.fmean(http_lat) - statistics.fmean(emb_lat)) * 1e3:.2f} ms/message "
+          f"({emb_rate / http_rate:.1f}x throughput); results identical")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
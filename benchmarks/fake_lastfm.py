@@ -0,0 +1,161 @@
+"""
+Local stand-in for ws.audioscrobbler.com, for benchmarks that must not need a key or network.
+
+FakeLastFM serves deterministic, realistically shaped payloads for the five
+methods lastfm.py calls (same params -> same body), with configurable
+latency, jitter and error rate, and counts calls per method. Plug it in
+with `await lastfm.startup(transport=fake.transport())`.
+"""
+import asyncio
+import hashlib
+import random
+from collections import Counter
+
+import httpx
+
+N_ARTISTS = 500
+
+
+def artist_name(i: int) -> str:
+    return f"Artist {i % N_ARTISTS}"
+
+
+def _rng(*parts) -> random.Random:
+    seed = hashlib.blake2b("\x1f".join(map(str, parts)).lower().encode(), digest_size=8).digest()
+    return random.Random(int.from_bytes(seed, "big"))
+
+
+def _image(url: str) -> list[dict]:
+    # Last.fm pads every entity with four image sizes; they are a good part of the bytes we parse
+    return [{"#text": f"{url}/{size}.png", "size": size} for size in ("small", "medium", "large", "extralarge")]
+
+
+def _track(rng: random.Random, artist: str, n: int) -> dict:
+    title = f"Title {rng.randint(0, 9999)}"
+    url = f"https://www.last.fm/music/{artist.replace(' ', '+')}/_/{title.replace(' ', '+')}"
+    return {
+        "name": title, "duration": str(rng.randint(120, 360)), "mbid": "", "url": url,
+        "streamable": {"#text": "0", "fulltrack": "0"},
+        "artist": {"name": artist, "mbid": "", "url": f"https://www.last.fm/music/{artist.replace(' ', '+')}"},
+        "image": _image(url), "@attr": {"rank": str(n + 1)},
+    }
+
+
+def _limit(params, default: int = 30) -> int:
+    try:
+        return max(1, min(int(params.get("limit", default)), 1000))
+    except ValueError:
+        return default
+
+
+def tag_top_tracks(params) -> dict:
+    tag, limit = params.get("tag", ""), _limit(params, 50)
+    rng = _rng("tag", tag)
+    tracks = [_track(rng, artist_name(rng.randrange(N_ARTISTS)), i) for i in range(limit)]
+    return {"tracks": {"track": tracks, "@attr": {"tag": tag, "page": "1", "perPage": str(limit), "total": "5000"}}}
+
+
+def track_search(params) -> dict:
+    query, limit = params.get("track", ""), _limit(params)
+    rng = _rng("track", query)
+    matches = []
+    for i in range(limit):
+        t = _track(rng, artist_name(rng.randrange(N_ARTISTS)), i)
+        matches.append({"name": t["name"], "artist": t["artist"]["name"], "url": t["url"], "streamable": "0",
+                        "listeners": str(rng.randint(10, 10**6)), "image": t["image"], "mbid": ""})
+    return {"results": {"opensearch:Query": {"#text": "", "role": "request", "searchTerms": query, "startPage": "1"},
+                        "opensearch:totalResults": "1000", "trackmatches": {"track": matches}, "@attr": {}}}
+
+
+def artist_similar(params) -> dict:
+    artist, limit = params.get("artist", ""), _limit(params, 100)
+    rng = _rng("similar", artist)
+    digits = "".join(c for c in artist if c.isdigit())
+    if digits:
+        # neighbours on a ring, so related artists share most of their similar lists, as on Last.fm
+        i = int(digits)
+        near = [(i + d) % N_ARTISTS for d in range(-limit, limit + 1) if d]
+        names = rng.sample(near, min(limit, len(near)))
+    else:
+        names = rng.sample(range(N_ARTISTS), min(limit, N_ARTISTS))
+    sims = [{"name": artist_name(i), "mbid": "", "match": f"{1 - j / (limit + 1):.6f}",
+             "url": f"https://www.last.fm/music/Artist+{i}", "image": _image(f"https://img/{i}"), "streamable": "0"}
+            for j, i in enumerate(names)]
+    return {"similarartists": {"artist": sims, "@attr": {"artist": artist}}}
+
+
+def artist_top_tracks(params) -> dict:
+    artist, limit = params.get("artist", ""), _limit(params, 50)
+    rng = _rng("top", artist)
+    tracks = [{**_track(rng, artist, i), "playcount": str(rng.randint(10**3, 10**7)),
+               "listeners": str(rng.randint(10**3, 10**6))} for i in range(limit)]
+    return {"toptracks": {"track": tracks, "@attr": {"artist": artist, "page": "1", "perPage": str(limit)}}}
+
+
+def artist_search(params) -> dict:
+    name = params.get("artist", "")
+    digits = "".join(c for c in name if c.isdigit())
+    if not digits:
+        return {"results": {"artistmatches": {"artist": []}, "opensearch:totalResults": "0"}}
+    canonical = artist_name(int(digits))
+    return {"results": {"artistmatches": {"artist": [{"name": canonical, "listeners": "12345", "mbid": "",
+                                                       "url": "https://www.last.fm/music/x", "streamable": "0",
+                                                       "image": _image("https://img/a")}]},
+                        "opensearch:totalResults": "1"}}
+
+
+METHODS = {
+    "tag.gettoptracks": tag_top_tracks,
+    "track.search": track_search,
+    "artist.getsimilar": artist_similar,
+    "artist.gettoptracks": artist_top_tracks,
+    "artist.search": artist_search,
+}
+
+
+class FakeLastFM:
+    """
+    httpx handler emulating Last.fm.
+
+    Each call sleeps `latency` plus an exponential tail with mean `jitter`
+    (plus `stall` seconds for a `stall_rate` fraction of calls, the stragglers
+    hedging is for), then fails with probability `error_rate` (half HTTP 503,
+    half API error 29 "rate limit exceeded", both of which lastfm.py retries).
+    """
+
+    def __init__(self, latency: float = 0.08, jitter: float = 0.03, error_rate: float = 0.0, seed: int = 1,
+                 stall_rate: float = 0.0, stall: float = 5.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self._rng = random.Random(seed)
+        self.calls: Counter[str] = Counter()
+        self.errors = 0
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def reset(self):
+        self.calls.clear()
+        self.errors = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        method = params.get("method", "")
+        self.calls[method] += 1
+        delay = self.latency + (self._rng.expovariate(1 / self.jitter) if self.jitter > 0 else 0)
+        if self._rng.random() < self.stall_rate:
+            delay += self.stall
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._rng.random() < self.error_rate:
+            self.errors += 1
+            if self._rng.random() < 0.5:
+                return httpx.Response(503, text="Service Unavailable")
+            return httpx.Response(200, json={"error": 29, "message": "Rate Limit Exceeded"})
+        build = METHODS.get(method)
+        if build is None:
+            return httpx.Response(200, json={"error": 3, "message": "Invalid Method"})
+        return httpx.Response(200, json=build(params))
@@ -0,0 +1,128 @@
+"""
+Micro-benchmark for parser.parse_prompt.
+
+Compares the precompiled matcher (with and without the memo) against the
+original per-keyword implementation, checks that both give identical
+results, and shows how mood detection scales as MOOD_MAP grows.
+
+    python -m benchmarks.parser_bench
+"""
+import random
+import re
+import string
+import time
+
+import parser
+from parser import ARTIST_SEP, MOOD_MAP, ParsedPrompt, parse_prompt
+
+PROMPTS = [
+    "hi", "hello there", "workout", "chill", "I am sad", "i'm happy today", "need to focus on deep work",
+    "like drake", "similar to taylor swift", "top tracks by katty pery", "top track by the weeknd",
+    "by adele", "tarkan - şımarık", "Daft Punk: Instant Crush", "rainy sunday morning coffee",
+    "something for a long drive at night", "lofi beats", "madonna", "bluegrass", "hype", "k-pop",
+    "songs that sound like summer", "heartbroken again", "study", "jazz", "angry metal",
+]
+
+
+# --- original implementation (reference for output and speed) ----------------
+
+def _legacy_detect_mood(t: str, mood_map: dict) -> str | None:
+    low = t.lower()
+    for mood, keywords in mood_map.items():
+        if any(k in low for k in keywords) or low.startswith(f"i am {mood}") or low.startswith(f"i'm {mood}"):
+            return mood
+    return None
+
+
+def legacy_parse(text: str, mood_map: dict = MOOD_MAP) -> ParsedPrompt:
+    t = (text or "").strip()
+    if not t:
+        return ParsedPrompt(intent="greeting", raw=t)
+    if t.lower() in {"hi", "hello", "hey", "yo", "sup"} or t.lower().startswith(("hi ", "hello ", "hey ")):
+        return ParsedPrompt(intent="greeting", raw=t)
+    mood = _legacy_detect_mood(t, mood_map)
+    if mood:
+        return ParsedPrompt(intent="mood", mood=mood, vibe=mood, raw=t)
+    if ARTIST_SEP.search(t):
+        parts = ARTIST_SEP.split(t, maxsplit=1)
+        if len(parts) == 2 and parts[0] and parts[1]:
+            return ParsedPrompt(intent="track", artist=parts[0].strip(), title=parts[1].strip(), raw=t)
+    m = re.search(r"(?:like|similar to)\s+(.+)$", t, re.IGNORECASE)
+    if m:
+        return ParsedPrompt(intent="artist_like", artist=m.group(1).strip(), raw=t)
+    m2 = re.search(r"^(?:top\s+(?:songs|tracks)\s+by|by)\s+(.+)$", t, re.IGNORECASE)
+    if not m2:
+        m2 = re.search(r"^top\s+(?:song|songs|track|tracks)\s+by\s+(.+)$", t, re.IGNORECASE)
+    if m2:
+        return ParsedPrompt(intent="artist_top", artist=m2.group(1).strip(), raw=t)
+    if len(t.split()) <= 3:
+        return ParsedPrompt(intent="vibe", vibe=t, raw=t)
+    return ParsedPrompt(intent="track", title=t, raw=t)
+
+
+# -----------------------------------------------------------------------------
+
+def _random_prompt(rng: random.Random) -> str:
+    words = [w for kws in MOOD_MAP.values() for w in kws] + ["like", "by", "top", "-", "tracks", "i am", "i'm"]
+    pieces = [rng.choice(words) if rng.random() < 0.4 else "".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 8)))
+              for _ in range(rng.randint(1, 6))]
+    s = " ".join(pieces)
+    return s.upper() if rng.random() < 0.1 else s
+
+
+def check_equivalence(n: int = 20000) -> int:
+    rng = random.Random(7)
+    corpus = PROMPTS + [_random_prompt(rng) for _ in range(n)]
+    for p in corpus:
+        assert parse_prompt(p) == legacy_parse(p), p
+    return len(corpus)
+
+
+def _rate(fn, prompts, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for p in prompts:
+            fn(p)
+    return rounds * len(prompts) / (time.perf_counter() - start)
+
+
+def _big_mood_map(n_keywords: int) -> dict:
+    rng = random.Random(n_keywords)
+    big = {mood: list(kws) for mood, kws in MOOD_MAP.items()}
+    moods = list(big)
+    for i in range(n_keywords):
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 12)))
+        big[moods[i % len(moods)]].append(word)
+    return big
+
+
+def main():
+    print(f"equivalence: {check_equivalence()} prompts identical to the original parser")
+
+    rounds = 2000
+    legacy = _rate(legacy_parse, PROMPTS, rounds)
+    memo = _rate(parse_prompt, PROMPTS, rounds)
+    cold = _rate(lambda p: parser._parse.__wrapped__(p.strip()), PROMPTS, rounds)
+    print(f"original parser      {legacy:>12,.0f} prompts/s")
+    print(f"precompiled, no memo {cold:>12,.0f} prompts/s  ({cold / legacy:.1f}x)")
+    print(f"precompiled + memo   {memo:>12,.0f} prompts/s  ({memo / legacy:.1f}x)")
+
+    print("\nmood detection vs MOOD_MAP size (no memo):")
+    saved = {m: list(k) for m, k in MOOD_MAP.items()}
+    try:
+        for n in (0, 1000, 5000, 20000):
+            big = _big_mood_map(n)
+            MOOD_MAP.clear()
+            MOOD_MAP.update(big)
+            parser.refresh_moods()
+            old = _rate(lambda p: _legacy_detect_mood(p, big), PROMPTS, 50)
+            new = _rate(parser._detect_mood, PROMPTS, 50)
+            print(f"  {sum(map(len, big.values())):>6} keywords: original {old:>10,.0f}/s  precompiled {new:>10,.0f}/s")
+    finally:
+        MOOD_MAP.clear()
+        MOOD_MAP.update(saved)
+        parser.refresh_moods()
+
+
+if __name__ == "__main__":
+    main()
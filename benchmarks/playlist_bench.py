@@ -0,0 +1,81 @@
+"""
+Batch playlists vs. one request per seed, against the fake Last.fm.
+
+Builds the same playlists twice from a cold cache: once the old way (one
+get_tracks_for_intent call per seed prompt, what calling /assist per seed
+amounts to) and once with playlist.iter_playlist. Reports upstream calls,
+wall time, time to the first track and duplicate tracks in the result.
+
+    python -m benchmarks.playlist_bench [size] [latency_s]
+"""
+import asyncio
+import math
+import os
+import sys
+import time
+
+os.environ["LASTFM_API_KEY"] = "offline-bench"
+
+import lastfm
+from artist_index import ArtistIndex
+from parser import parse_prompt
+from playlist import CallPlan, iter_playlist
+from ratelimit import TokenBucket
+
+from benchmarks.fake_lastfm import FakeLastFM
+
+SEED_SETS = [
+    ["like Artist 1", "like Artist 2", "similar to Artist 3", "like Artist 4"],
+    ["chill", "workout", "jazz", "top tracks by Artist 12", "like Artist 12"],
+    ["like Artist 7", "top tracks by Artist 7", "Artist 7 - Title 3", "like Artist 8", "i am sad", "happy"],
+]
+
+
+def cold(fake: FakeLastFM):
+    lastfm._cache.clear()
+    lastfm._artist_index = ArtistIndex()
+    fake.reset()
+
+
+async def per_seed(prompts: list[str], size: int):
+    quota = math.ceil(size / len(prompts))
+    started, first, out = time.perf_counter(), None, []
+    for p in prompts:
+        tracks = await lastfm.get_tracks_for_intent(parse_prompt(p), limit=quota)
+        if tracks and first is None:
+            first = time.perf_counter() - started
+        out += tracks
+    return out[:size], first, time.perf_counter() - started
+
+
+async def batched(prompts: list[str], size: int):
+    started, first, out = time.perf_counter(), None, []
+    async for t in iter_playlist(prompts, size, plan=CallPlan()):
+        if first is None:
+            first = time.perf_counter() - started
+        out.append(t)
+    return out, first, time.perf_counter() - started
+
+
+async def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.08
+    fake = FakeLastFM(latency=latency, jitter=latency / 3)
+    await lastfm.startup(transport=fake.transport())
+    lastfm._limiter = TokenBucket(0, 1)  # measure call counts and latency, not the rate limit
+    print(f"playlists of {size}, fake Last.fm {latency * 1e3:.0f} ms")
+    try:
+        for prompts in SEED_SETS:
+            print(f"\n{len(prompts)} seeds: {', '.join(prompts)}")
+            for label, fn in (("per seed", per_seed), ("batched", batched)):
+                cold(fake)
+                tracks, first, total = await fn(prompts, size)
+                dupes = len(tracks) - len({(t["artist"].lower(), t["title"].lower()) for t in tracks})
+                print(f"  {label:<9} {len(tracks):>4} tracks  {sum(fake.calls.values()):>4} upstream calls  "
+                      f"first {first * 1e3:6.0f} ms  total {total * 1e3:6.0f} ms  {dupes} duplicates")
+    finally:
+        await lastfm.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
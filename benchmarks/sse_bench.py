@@ -0,0 +1,188 @@
+"""
+Benchmark for the bot's SSE handling.
+
+Builds a large synthetic /assist stream in the exact framing DefaultServer
+uses, cuts it into socket-sized chunks and decodes it two ways:
+
+  * the original path: incremental text decode, line splitting, prefix
+    checks and a json-per-chunk _process_event with shape probes;
+  * sse.SSEDecoder on raw bytes + bot.AgentReply's handler table.
+
+Reports events/second and transient memory while decoding (peak minus
+what the collected chunks keep), and checks both produce the same
+plan/links/final text. Needs the bot's dependencies (discord.py).
+
+    python -m benchmarks.sse_bench [n_events]
+"""
+import codecs
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from bot import AgentReply
+from sse import SSEDecoder
+
+
+def synthetic_stream(n_events: int) -> bytes:
+    rng = random.Random(3)
+    out = []
+
+    def emit(name: str, body: dict):
+        body = {"schema_version": "1.0", "id": "01K0000000000000000000000", "source": "01K0000000000000000000001",
+                "metadata": None, "event_name": name, **body}
+        out.append(f"event: {name}\ndata: {json.dumps(body)}\n\n")
+
+    emit("PLAN", {"content_type": "atomic.textblock", "content": "Interpreting as 'similar to drake'."})
+    for i in range(n_events - 3):
+        line = f"- Artist {rng.randint(0, 999)} — Title {i} ✨\n"
+        emit("FINAL_RESPONSE", {"content_type": "chunked.text", "stream_id": "s1", "is_complete": False, "content": line})
+    links = [{"artist": f"A{i}", "title": f"T{i}", "youtube": f"https://www.youtube.com/results?search_query=A{i}+T{i}"}
+             for i in range(5)]
+    emit("SOURCES", {"content_type": "atomic.json", "content": {"links": links}})
+    emit("done", {"content_type": "atomic.done"})
+    return "".join(out).encode("utf-8")
+
+
+def chunked(data: bytes, size: int = 4096):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+# --- original implementation --------------------------------------------------
+
+def _legacy_process_event(ev_type, data_str, plan_chunks, final_chunks, links_ref):
+    import json as _json
+
+    try:
+        obj = _json.loads(data_str)
+    except _json.JSONDecodeError:
+        return
+    ct = (obj.get("content_type") or "").lower()  # noqa: F841
+    en = (obj.get("event_name") or ev_type or "").upper()
+    content = obj.get("content")
+    if not en and obj.get("eventType"):
+        en = str(obj.get("eventType")).upper()
+    if content is None and obj.get("payload") is not None:
+        payload = obj.get("payload") or {}
+        if isinstance(payload, dict):
+            if "text" in payload or "content" in payload:
+                content = payload.get("text") or payload.get("content")
+            elif "json" in payload:
+                content = payload.get("json")
+            elif "data" in payload:
+                content = payload.get("data")
+    if en in {"PLAN", "WARNING", "ERROR"}:
+        if isinstance(content, str) and content.strip():
+            plan_chunks.append(f"**{en}:** {content.strip()}")
+        return
+    if en == "SOURCES":
+        links = None
+        if isinstance(content, dict) and isinstance(content.get("links"), list):
+            links = content.get("links")
+        if links is None and isinstance(content, list):
+            links = content
+        if links is not None:
+            links_ref.clear()
+            links_ref.extend(links)
+        return
+    if en == "FINAL_RESPONSE":
+        if isinstance(content, str) and content:
+            final_chunks.append(content)
+        return
+
+
+def _legacy_lines(chunks):
+    # roughly what httpx's aiter_lines does: incremental text decode + line split
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    pending = ""
+    for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        lines = text.splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        for line in lines:
+            yield line.rstrip("\r\n")
+    if pending:
+        yield pending
+
+
+def legacy_decode(chunks):
+    plan_chunks, links, final_chunks = [], [], []
+    current_event, current_data_parts = None, []
+    for line in _legacy_lines(chunks):
+        if line.startswith(":"):
+            continue
+        if line.startswith("event:"):
+            if current_data_parts:
+                _legacy_process_event(current_event or "message", "\n".join(current_data_parts),
+                                      plan_chunks, final_chunks, links)
+                current_data_parts = []
+            current_event = line[len("event:"):].strip()
+            continue
+        if line.startswith("data:"):
+            current_data_parts.append(line[len("data:"):].strip())
+            continue
+        if line == "":
+            if current_data_parts:
+                _legacy_process_event(current_event or "message", "\n".join(current_data_parts),
+                                      plan_chunks, final_chunks, links)
+            current_event, current_data_parts = None, []
+    if current_data_parts:
+        _legacy_process_event(current_event or "message", "\n".join(current_data_parts),
+                              plan_chunks, final_chunks, links)
+    return plan_chunks, links, final_chunks
+
+
+def legacy_result(state) -> dict:
+    plan_chunks, links, final_chunks = state
+    return {"plan_text": "\n".join(plan_chunks).strip(), "links": links, "final_text": "".join(final_chunks).strip()}
+
+
+# -----------------------------------------------------------------------------
+
+def new_decode(chunks) -> AgentReply:
+    reply = AgentReply()
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        for ev in decoder.feed(chunk):
+            reply.feed_sse(ev)
+    for ev in decoder.flush():
+        reply.feed_sse(ev)
+    return reply
+
+
+def _measure(fn, chunks, n_events: int, rounds: int = 3):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    # transient memory: peak while decoding minus what the collected chunks keep alive
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = fn(chunks)
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return n_events / best, peak - kept, kept - base
+
+
+def main():
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    data = synthetic_stream(n_events)
+    chunks = chunked(data)
+    crlf_chunks = chunked(data.replace(b"\n", b"\r\n"), 4093)  # odd size so CRLFs get split across chunks
+
+    expected = legacy_result(legacy_decode(chunks))
+    assert expected == new_decode(chunks).result() == new_decode(crlf_chunks).result()
+    print(f"{n_events:,} events, {len(data) / 1e6:.1f} MB, {len(chunks)} chunks; outputs identical")
+
+    old_rate, old_transient, old_kept = _measure(legacy_decode, chunks, n_events)
+    new_rate, new_transient, new_kept = _measure(new_decode, chunks, n_events)
+    print(f"original   {old_rate:>10,.0f} events/s  transient {old_transient / 1e3:8.1f} kB  result {old_kept / 1e6:.1f} MB")
+    print(f"SSEDecoder {new_rate:>10,.0f} events/s  transient {new_transient / 1e3:8.1f} kB  result {new_kept / 1e6:.1f} MB"
+          f"  ({new_rate / old_rate:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
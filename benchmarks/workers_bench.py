@@ -0,0 +1,82 @@
+"""
+/assist throughput with 1, 2, 4... agent worker processes.
+
+Starts music_agent.py with AGENT_WORKERS=n on a spare port and no Last.fm
+key, so every request takes the fallback path: what is measured is the
+per-process work (request JSON, agent, SSE framing) that extra workers are
+meant to spread over cores. Load comes from loadgen's closed loop.
+
+    python -m benchmarks.workers_bench [--workers 1,2,4] [--requests 2000] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from loadgen import closed_loop
+
+PROMPTS = ["i am sad", "like Drake", "chill", "top tracks by Adele", "Daft Punk - One More Time"]
+
+
+async def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url.replace("/assist", "/metrics"))
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise SystemExit(f"agent at {url} did not come up")
+
+
+async def run(workers: int, port: int, requests: int, concurrency: int) -> float:
+    state = os.path.join(tempfile.mkdtemp(), "state.db")
+    env = {**os.environ, "LASTFM_API_KEY": "", "AGENT_WORKERS": str(workers), "AGENT_PORT": str(port),
+           "SHARED_STATE_PATH": state, "PREFETCH": "0"}
+    proc = subprocess.Popen([sys.executable, "music_agent.py"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/assist"
+    try:
+        await wait_ready(url)
+        rows = itertools.cycle({"prompt": p, "conversation_id": f"bench-{i}"} for i, p in enumerate(PROMPTS))
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            await closed_loop(client, url, rows, concurrency * 2, concurrency, 0, 30, [])  # warm up
+            records: list[dict] = []
+            started = time.perf_counter()
+            await closed_loop(client, url, rows, requests, concurrency, 0, 30, records)
+            elapsed = time.perf_counter() - started
+        errors = sum(bool(r["error"]) for r in records)
+        if errors:
+            print(f"  ({errors} errors)")
+        return len(records) / elapsed
+    finally:
+        proc.terminate()
+        proc.wait(30)
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+
+    print(f"{os.cpu_count()} cores; {args.requests} requests at concurrency {args.concurrency}")
+    base = None
+    for n in (int(w) for w in args.workers.split(",")):
+        rate = await run(n, args.port, args.requests, args.concurrency)
+        base = base or rate
+        print(f"  {n:>2} workers  {rate:8,.0f} req/s  ({rate / base:.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
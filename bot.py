@@ -1,11 +1,19 @@
 import os,time
+import sys
 import json
+import math
+import signal
 import asyncio
+import contextlib
+import subprocess
+from collections import deque
 import discord
 import httpx
 from pathlib import Path
 from dotenv import load_dotenv
-from simple_sse_client import async_stream
+
+from sse import SSEDecoder, SSEEvent
+from envelope import assist_request
 
 # Load .env from the same folder as this file 
 ENV_PATH = Path(__file__).with_name(".env")
@@ -13,174 +21,365 @@ load_dotenv(dotenv_path=ENV_PATH)
 
 TOKEN = (os.getenv("DISCORD_TOKEN") or "").strip()
 AGENT_URL = (os.getenv("AGENT_URL") or "").strip()
+# "http" talks to a separate agent server; "embedded" runs MusicAgent inside the bot process
+AGENT_MODE = (os.getenv("AGENT_MODE") or "http").strip().lower()
 
 # Fallback if AGENT_URL missing/invalid
 if not AGENT_URL.lower().startswith(("http://", "https://")):
     AGENT_URL = "http://127.0.0.1:8000/assist"
 
+# Agent connection + admission limits
+AGENT_CONNECT_TIMEOUT = float(os.getenv("AGENT_CONNECT_TIMEOUT", "5"))
+AGENT_READ_TIMEOUT = float(os.getenv("AGENT_READ_TIMEOUT", "30"))      # max silence between SSE bytes
+AGENT_STREAM_TIMEOUT = float(os.getenv("AGENT_STREAM_TIMEOUT", "90"))  # whole /assist stream
+AGENT_MAX_INFLIGHT = int(os.getenv("AGENT_MAX_INFLIGHT", "32"))        # open /assist streams, all guilds
+AGENT_MAX_PER_GUILD = int(os.getenv("AGENT_MAX_PER_GUILD", "4"))
+AGENT_MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", "64"))              # messages allowed to wait for a slot
+AGENT_QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT", "10"))    # seconds one may wait before we shed it
+
+BUSY_REPLY = "I'm getting a lot of requests right now — try again in a moment 🙏"
+
+# Gateway sharding: "" = one connection, "auto" = Discord's recommended shard count, N = that many shards.
+# DISCORD_SHARD_PROCS > 1 spreads the shards over that many bot processes (DISCORD_SHARD_IDS is set
+# for each child; set it yourself to run a fixed slice of shards, e.g. one per host).
+DISCORD_SHARDS = (os.getenv("DISCORD_SHARDS") or "").strip().lower()
+DISCORD_SHARD_IDS = (os.getenv("DISCORD_SHARD_IDS") or "").strip()
+DISCORD_SHARD_PROCS = int(os.getenv("DISCORD_SHARD_PROCS", "1"))
+SHARD_STATS_INTERVAL = float(os.getenv("SHARD_STATS_INTERVAL", "60"))  # seconds between per-shard stat lines, 0 = off
+
 intents = discord.Intents.default()
 intents.message_content = True
-bot = discord.Client(intents=intents)
 
 
-def new_ulid() -> str:
-    # ULID generator 
-    t = int(time.time() * 1000).to_bytes(6, "big")
-    r = os.urandom(10)
-    data = int.from_bytes(t + r, "big")
-    alphabet = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
-    out = []
-    for _ in range(26):
-        out.append(alphabet[data & 31])
-        data >>= 5
-    return "".join(reversed(out))
+def make_client() -> discord.Client:
+    if DISCORD_SHARDS not in ("", "auto") and not DISCORD_SHARDS.isdigit():
+        raise SystemExit(f"DISCORD_SHARDS must be empty, 'auto' or a number, not {DISCORD_SHARDS!r}")
+    if DISCORD_SHARD_IDS and not DISCORD_SHARDS.isdigit():
+        # discord.py can only run a slice of shards if it knows how many there are in total
+        raise SystemExit("DISCORD_SHARD_IDS needs DISCORD_SHARDS set to the total shard count, "
+                         "e.g. DISCORD_SHARDS=8 DISCORD_SHARD_IDS=0,1,2,3")
+    if not DISCORD_SHARDS:
+        return discord.Client(intents=intents)
+    options = {}
+    if DISCORD_SHARDS != "auto":
+        options["shard_count"] = int(DISCORD_SHARDS)
+    if DISCORD_SHARD_IDS:
+        options["shard_ids"] = [int(i) for i in DISCORD_SHARD_IDS.split(",")]
+    return discord.AutoShardedClient(intents=intents, **options)
 
 
-# --- Agent streaming helper --------------------------------------------------
+bot = make_client()
 
-async def ask_agent(prompt: str, user_id: str | None = None, conversation_id: str | None = None):
-    """
-    Stream events from /assist using httpx directly.
-    Parse minimal SSE: lines starting with 'event:' and 'data:'.
-    Always returns {plan_text, links, final_text} with safe fallbacks.
+
+# --- Agent connection + admission control -------------------------------------
+
+_agent_client: httpx.AsyncClient | None = None
+
+
+def agent_client() -> httpx.AsyncClient:
+    """One long-lived pooled client for every /assist call."""
+    global _agent_client
+    if _agent_client is None or _agent_client.is_closed:
+        _agent_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(AGENT_READ_TIMEOUT, connect=AGENT_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=AGENT_MAX_INFLIGHT, max_keepalive_connections=AGENT_MAX_INFLIGHT),
+        )
+    return _agent_client
+
+
+async def close_agent_client():
+    global _agent_client
+    client, _agent_client = _agent_client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+_embedded = None
+
+
+async def start_embedded_agent():
+    """AGENT_MODE=embedded: build the in-process agent (imported lazily; split deployments don't need its deps)."""
+    global _embedded
+    if _embedded is None:
+        from embedded import EmbeddedAgent
+
+        _embedded = EmbeddedAgent()
+        await _embedded.start()
+    return _embedded
+
+
+async def close_embedded_agent():
+    global _embedded
+    agent, _embedded = _embedded, None
+    if agent is not None:
+        await agent.close()
+
+
+class AgentBusy(Exception):
+    """Raised when a message can't get an agent slot quickly enough."""
+
+
+class AgentGate:
     """
-    plan_chunks, links, final_chunks = [], [], []
-
-    buf_session = {
-    "processor_id": new_ulid(),
-    "activity_id": new_ulid(),
-    "request_id": new_ulid(),
-    "conversation_id": conversation_id or new_ulid(),
-    "client": "discord-bot",
-    "interactions": [],
-}
-    if user_id:
-        buf_session["user_id"] = user_id
-
-    buffer = {
-        "query": {
-            "id": new_ulid(),
-            "prompt": prompt
-        },
-        "session": buf_session
-    }
-    payload = json.dumps(buffer)
+    Caps open agent requests globally and per guild.
 
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "text/event-stream",
-    }
+    At most `max_queue` messages may wait for a slot, each for at most
+    `queue_timeout` seconds; anything beyond that raises AgentBusy right
+    away instead of piling up coroutines.
+    """
 
+    def __init__(self, max_inflight: int, per_guild: int, max_queue: int, queue_timeout: float):
+        self.per_guild = per_guild
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._global = asyncio.Semaphore(max_inflight)
+        self._guilds: dict[str, list] = {}  # guild id -> [semaphore, users]
+        self.waiting = 0
+        self.inflight = 0
+        self.shed = 0
+
+    def _guild(self, guild_id: str) -> asyncio.Semaphore:
+        entry = self._guilds.get(guild_id)
+        if entry is None:
+            entry = self._guilds[guild_id] = [asyncio.Semaphore(self.per_guild), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _unguild(self, guild_id: str):
+        entry = self._guilds[guild_id]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._guilds[guild_id]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, guild_id: str):
+        if self.waiting >= self.max_queue:
+            self.shed += 1
+            raise AgentBusy()
+        guild_sem = self._guild(guild_id)
+        self.waiting += 1
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await guild_sem.acquire()
+                try:
+                    await self._global.acquire()
+                except BaseException:
+                    guild_sem.release()
+                    raise
+        except TimeoutError:
+            self._unguild(guild_id)
+            self.shed += 1
+            raise AgentBusy() from None
+        except BaseException:
+            self._unguild(guild_id)
+            raise
+        finally:
+            self.waiting -= 1
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._global.release()
+            guild_sem.release()
+            self._unguild(guild_id)
+
+
+_gates: dict[int, AgentGate] = {}
+
+
+def agent_gate(shard_id: int) -> AgentGate:
+    """
+    The admission gate for one shard.
 
-    try:
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream("POST", AGENT_URL, headers=headers, content=payload) as resp:
-                ctype = resp.headers.get("content-type", "")
+    AGENT_MAX_INFLIGHT / AGENT_MAX_QUEUE are totals for the whole bot, so each
+    shard gets an even share of them (rounded up), however the shards are
+    spread over processes, and a busy shard can't take slots from the quiet
+    ones. Every shard gets at least one slot, so with more shards than
+    AGENT_MAX_INFLIGHT the real cap is one request per shard.
+    """
+    gate = _gates.get(shard_id)
+    if gate is None:
+        shards = bot.shard_count or 1
+        gate = _gates[shard_id] = AgentGate(
+            max(1, math.ceil(AGENT_MAX_INFLIGHT / shards)), AGENT_MAX_PER_GUILD,
+            max(1, math.ceil(AGENT_MAX_QUEUE / shards)), AGENT_QUEUE_TIMEOUT,
+        )
+    return gate
+
+
+class ShardStats:
+    """Per-shard counters: messages seen, agent replies and their latency (since the last report)."""
+
+    __slots__ = ("events", "replies", "latencies", "_since")
+
+    def __init__(self):
+        self.events = 0
+        self.replies = 0
+        self.latencies: deque[float] = deque(maxlen=1024)
+        self._since = time.monotonic()
+
+    def take(self, reset: bool = True) -> dict:
+        """Numbers for the interval since the last reset (and start a new one)."""
+        now = time.monotonic()
+        lat = sorted(self.latencies)
+        out = {
+            "events_per_s": self.events / max(1e-9, now - self._since),
+            "replies": self.replies,
+            "p50": lat[len(lat) // 2] if lat else None,
+            "p95": lat[min(len(lat) - 1, int(len(lat) * 0.95))] if lat else None,
+        }
+        if reset:
+            self.events = self.replies = 0
+            self.latencies.clear()
+            self._since = now
+        return out
+
+
+_shard_stats: dict[int, ShardStats] = {}
+
+
+def shard_stats(shard_id: int) -> ShardStats:
+    stats = _shard_stats.get(shard_id)
+    if stats is None:
+        stats = _shard_stats[shard_id] = ShardStats()
+    return stats
+
+
+def _ms(seconds: float | None) -> str:
+    if seconds is None or not math.isfinite(seconds):
+        return "-"
+    return f"{seconds * 1e3:.0f}ms"
+
+
+def shard_report(reset: bool = True) -> list[str]:
+    """One line per shard this process runs."""
+    lines = []
+    latencies = dict(bot.latencies) if isinstance(bot, discord.AutoShardedClient) else {0: bot.latency}
+    for shard_id in sorted(set(latencies) | set(_shard_stats)):
+        s = shard_stats(shard_id).take(reset)
+        gate = _gates.get(shard_id)
+        lines.append(
+            f"shard {shard_id}: {s['events_per_s']:.2f} msg/s, "
+            f"agent {gate.inflight if gate else 0} in flight / {gate.waiting if gate else 0} waiting / "
+            f"{gate.shed if gate else 0} shed, {s['replies']} replies p50 {_ms(s['p50'])} p95 {_ms(s['p95'])}, "
+            f"gateway {_ms(latencies.get(shard_id))}"
+        )
+    return lines
 
-                if "text/event-stream" not in ctype:
-                    # read body BEFORE leaving the context; stream is still open here
-                    text = await resp.aread()
-                    try:
-                        snippet = text.decode("utf-8", errors="replace")
-                    except Exception:
-                        snippet = repr(text)
-                    plan_chunks.append(f"**ERROR:** agent returned {resp.status_code} {ctype}:\n{snippet}")
-                else:
-                    current_event = None
-                    current_data_parts = []
-
-                    async for line in resp.aiter_lines():
-                        if line is None:
-                            continue
-                        line = line.rstrip("\r\n")
-
-                        if line.startswith(":"):
-                            continue
-
-                        if line.startswith("event:"):
-                            # flush any previous block first
-                            if current_data_parts:
-                                #used for debugging
-                                #print("[SSE data]", ("\n".join(current_data_parts))[:300])
-                                _process_event(
-                                    current_event or "message",
-                                    "\n".join(current_data_parts),
-                                    plan_chunks, final_chunks, links
-                                )
-                                current_data_parts = []
-                            current_event = line[len("event:"):].strip()
-                            continue
-
-                        if line.startswith("data:"):
-                            current_data_parts.append(line[len("data:"):].strip())
-                            continue
-
-                        if line == "":
-                            # blank line => dispatch even if no 'event:' header was seen
-                            if current_data_parts:
-                                #used for debugging
-                                #print("[SSE data]", ("\n".join(current_data_parts))[:300])
-                                _process_event(
-                                    current_event or "message",
-                                    "\n".join(current_data_parts),
-                                    plan_chunks, final_chunks, links
-                                )
-                            current_event, current_data_parts = None, []
-                            continue
 
-                    # flush tail
-                    if current_data_parts:
-                        #used for debugging
-                        #print("[SSE data]", ("\n".join(current_data_parts))[:300])
-                        _process_event(
-                            current_event or "message",
-                            "\n".join(current_data_parts),
-                            plan_chunks, final_chunks, links
-                        )
+async def report_shard_stats():
+    while True:
+        await asyncio.sleep(SHARD_STATS_INTERVAL)
+        for line in shard_report():
+            print(line)
 
-    except Exception as e:
-        plan_chunks.append(f"**ERROR:** agent unavailable ({e}).")
 
-    plan_text = "\n".join(plan_chunks).strip()
-    final_text = "".join(final_chunks).strip()
+# --- Agent streaming helper --------------------------------------------------
 
-    if not links:
-        # safe fallback if we hit with any errors so we still have something to show
-        links = [
-            {"artist": "The Weeknd", "title": "Blinding Lights",
-             "youtube": "https://www.youtube.com/results?search_query=The+Weeknd+Blinding+Lights"},
-            {"artist": "ODESZA", "title": "A Moment Apart",
-             "youtube": "https://www.youtube.com/results?search_query=ODESZA+A+Moment+Apart"},
-            {"artist": "Daft Punk", "title": "Instant Crush",
-             "youtube": "https://www.youtube.com/results?search_query=Daft+Punk+Instant+Crush"},
-        ]
+_json_decode = json.JSONDecoder().decode
 
-    return {"plan_text": plan_text, "links": links, "final_text": final_text}
+FALLBACK_LINKS = [
+    {"artist": "The Weeknd", "title": "Blinding Lights",
+     "youtube": "https://www.youtube.com/results?search_query=The+Weeknd+Blinding+Lights"},
+    {"artist": "ODESZA", "title": "A Moment Apart",
+     "youtube": "https://www.youtube.com/results?search_query=ODESZA+A+Moment+Apart"},
+    {"artist": "Daft Punk", "title": "Instant Crush",
+     "youtube": "https://www.youtube.com/results?search_query=Daft+Punk+Instant+Crush"},
+]
 
 
-def _process_event(ev_type: str, data_str: str, plan_chunks: list, final_chunks: list, links_ref: list):
+class AgentReply:
     """
+    Collects agent events into {plan_text, links, final_text}.
+
     Handles Sentient 'atomic'/'chunked' schema:
       - atomic.textblock  + event_name: PLAN/WARNING/ERROR  -> content: str
       - atomic.json       + event_name: SOURCES             -> content: {"links":[...]}
       - chunked.text      + event_name: FINAL_RESPONSE      -> content: "..." (streamed), is_complete flag
     Also tolerates older shapes (eventType/payload) if present.
     """
-    import json as _json
 
-    try:
-        obj = _json.loads(data_str)
-    except _json.JSONDecodeError:
-        return
+    __slots__ = ("plan_chunks", "links", "final_chunks", "on_change")
+
+    def __init__(self, on_change=None):
+        self.plan_chunks: list[str] = []
+        self.links: list[dict] = []
+        self.final_chunks: list[str] = []
+        # called as on_change(reply) after every rendered event (progressive Discord updates)
+        self.on_change = on_change
+
+    # --- PLAN / WARNING / ERROR (text block) ---
+    def on_text_block(self, name: str, content):
+        if isinstance(content, str) and content.strip():
+            self.plan_chunks.append(f"**{name}:** {content.strip()}")
+
+    # --- SOURCES (json block) ---
+    def on_sources(self, name: str, content):
+        # expected shape for your server: content = {"links":[...]}
+        links = None
+        if isinstance(content, dict) and isinstance(content.get("links"), list):
+            links = content["links"]
+        # tolerate alt locations (older shapes)
+        elif isinstance(content, list):
+            links = content
+        if links is not None:
+            self.links = list(links)
+
+    # --- FINAL_RESPONSE (streamed text) ---
+    def on_final(self, name: str, content):
+        if isinstance(content, str) and content:
+            self.final_chunks.append(content)
+
+    def dispatch(self, name: str, content):
+        handler = EVENT_HANDLERS.get(name)
+        if handler is None:
+            name = name.upper()
+            handler = EVENT_HANDLERS.get(name)
+        if handler is not None:
+            handler(self, name, content)
+            if self.on_change is not None:
+                self.on_change(self)
+
+    def feed_sse(self, ev: SSEEvent):
+        """Route one decoded SSE event; named events we don't render skip JSON parsing entirely."""
+        name = ev.event
+        if name not in EVENT_HANDLERS and name.upper() not in EVENT_HANDLERS and name != "message":
+            return  # 'done' and other atomic.* or chunked.* you don't use
+        try:
+            obj = _json_decode(ev.data)
+        except ValueError:
+            return
+        if not isinstance(obj, dict):
+            return
+        en = obj.get("event_name")
+        content = obj.get("content")
+        if not en or content is None:
+            en, content = _legacy_shape(obj, en or name, content)
+        self.dispatch(en, content)
+
+    def result(self) -> dict:
+        # safe fallback if we hit with any errors so we still have something to show
+        return {
+            "plan_text": "\n".join(self.plan_chunks).strip(),
+            "links": self.links or list(FALLBACK_LINKS),
+            "final_text": "".join(self.final_chunks).strip(),
+        }
+
+
+EVENT_HANDLERS = {
+    "PLAN": AgentReply.on_text_block,
+    "WARNING": AgentReply.on_text_block,
+    "ERROR": AgentReply.on_text_block,
+    "SOURCES": AgentReply.on_sources,
+    "FINAL_RESPONSE": AgentReply.on_final,
+}
 
-    # Primary fields for  server
-    ct = (obj.get("content_type") or "").lower()
-    en = (obj.get("event_name") or ev_type or "").upper()
-    content = obj.get("content")
 
+def _legacy_shape(obj: dict, en: str, content):
     # Fallbacks for older/other shapes
     if not en and obj.get("eventType"):
-        en = str(obj.get("eventType")).upper()
+        en = str(obj.get("eventType"))
     if content is None and obj.get("payload") is not None:
         payload = obj.get("payload") or {}
         # try typical payload keys
@@ -191,35 +390,62 @@ def _process_event(ev_type: str, data_str: str, plan_chunks: list, final_chunks:
                 content = payload.get("json")
             elif "data" in payload:
                 content = payload.get("data")
+    return en or "", content
 
-    # --- PLAN / WARNING / ERROR (text block) ---
-    if en in {"PLAN", "WARNING", "ERROR"}:
-        if isinstance(content, str) and content.strip():
-            plan_chunks.append(f"**{en}:** {content.strip()}")
-        return
 
-    # --- SOURCES (json block) ---
-    if en == "SOURCES":
-        # expected shape for your server: content = {"links":[...]}
-        links = None
-        if isinstance(content, dict) and isinstance(content.get("links"), list):
-            links = content.get("links")
-        # tolerate alt locations (older shapes)
-        if links is None and isinstance(content, list):
-            links = content
-        if links is not None:
-            links_ref.clear()
-            links_ref.extend(links)
-        return
+async def ask_agent(prompt: str, user_id: str | None = None, conversation_id: str | None = None, on_change=None):
+    """
+    Stream events from /assist using httpx directly, decoding SSE from raw bytes,
+    or (AGENT_MODE=embedded) call the in-process agent with the same request body.
+    on_change(reply) fires after each PLAN/SOURCES/FINAL_RESPONSE event.
+    Always returns {plan_text, links, final_text} with safe fallbacks.
+    """
+    reply = AgentReply(on_change)
+
+    buffer = assist_request(prompt, user_id=user_id, conversation_id=conversation_id)
+    if AGENT_MODE == "embedded":
+        try:
+            async with asyncio.timeout(AGENT_STREAM_TIMEOUT):
+                agent = _embedded or await start_embedded_agent()
+                await agent.assist(buffer, reply.dispatch)
+        except Exception as e:
+            reply.plan_chunks.append(f"**ERROR:** agent failed ({e}).")
+        return reply.result()
 
-    # --- FINAL_RESPONSE (streamed text) ---
-    if en == "FINAL_RESPONSE":
-        if isinstance(content, str) and content:
-            final_chunks.append(content)
-        return
+    payload = json.dumps(buffer)
+
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+    }
+
+
+    try:
+        async with asyncio.timeout(AGENT_STREAM_TIMEOUT):
+            async with agent_client().stream("POST", AGENT_URL, headers=headers, content=payload) as resp:
+                ctype = resp.headers.get("content-type", "")
+
+                if "text/event-stream" not in ctype:
+                    # read body BEFORE leaving the context; stream is still open here
+                    text = await resp.aread()
+                    try:
+                        snippet = text.decode("utf-8", errors="replace")
+                    except Exception:
+                        snippet = repr(text)
+                    reply.plan_chunks.append(f"**ERROR:** agent returned {resp.status_code} {ctype}:\n{snippet}")
+                else:
+                    decoder = SSEDecoder()
+                    async for chunk in resp.aiter_bytes():
+                        for ev in decoder.feed(chunk):
+                            reply.feed_sse(ev)
+                    # flush tail
+                    for ev in decoder.flush():
+                        reply.feed_sse(ev)
 
-    # ignore 'done' and other atomic.* or chunked.* you don't use
-    return
+    except Exception as e:
+        reply.plan_chunks.append(f"**ERROR:** agent unavailable ({e}).")
+
+    return reply.result()
 
 
 def format_links(links: list[dict], limit: int = 5) -> str:
@@ -235,18 +461,160 @@ def format_links(links: list[dict], limit: int = 5) -> str:
         out.append(f"- **{artist} — {title}**\n{url}")
     return "\n".join(out)
 
+
+# --- Progressive replies -------------------------------------------------------
+
+DISCORD_LIMIT = 2000
+EDIT_INTERVAL = float(os.getenv("DISCORD_EDIT_INTERVAL", "1.2"))  # min seconds between edits in one channel
+PLACEHOLDER = "*working on it…*"
+
+_next_edit: dict[int, float] = {}  # channel id -> earliest time the next edit there may go out
+
+
+def reserve_edit(channel_id: int, earliest: float, interval: float = EDIT_INTERVAL) -> float:
+    """
+    Book the channel's next edit slot at or after `earliest` (monotonic time); returns seconds to wait.
+
+    Slots are per channel, not per reply, so several replies streaming in one
+    channel share Discord's per-channel edit limit instead of each using it up.
+    """
+    now = time.monotonic()
+    at = max(now, earliest, _next_edit.get(channel_id, 0.0))
+    _next_edit[channel_id] = at + interval
+    if len(_next_edit) > 4096:
+        for cid in [c for c, t in _next_edit.items() if t < now]:
+            del _next_edit[cid]
+    return at - now
+
+
+def split_message(text: str, limit: int = DISCORD_LIMIT) -> list[str]:
+    """Split into Discord-sized pages, preferring line breaks; over-long lines are hard-split."""
+    pages, cur = [], ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if cur:
+                pages.append(cur)
+                cur = ""
+            pages.append(line[:limit])
+            line = line[limit:]
+        if not cur:
+            cur = line
+        elif len(cur) + 1 + len(line) <= limit:
+            cur += "\n" + line
+        else:
+            pages.append(cur)
+            cur = line
+    if cur or not pages:
+        pages.append(cur or "\u200b")  # Discord rejects empty messages
+    return pages
+
+
+def render_progress(reply: AgentReply) -> str:
+    plan_text = "\n".join(reply.plan_chunks).strip() or PLACEHOLDER
+    picks = "".join(reply.final_chunks).strip()
+    body = f"**Plan**\n{plan_text}"
+    if picks:
+        body += f"\n\n**Suggestions**\n{picks}"
+    return body
+
+
+def render_final(result: dict) -> str:
+    plan_text = result["plan_text"] or PLACEHOLDER
+    return f"**Plan**\n{plan_text}\n\n**Suggestions**\n{format_links(result['links'], limit=5)}"
+
+
+class LiveReply:
+    """
+    A reply that is posted right away and then edited as agent events arrive.
+
+    update() only records the latest text; a single pending task applies it
+    at most once per `interval` seconds, so bursts of events collapse into
+    one edit. Edits also book a slot with reserve_edit(), so all replies in
+    a channel together stay inside Discord's per-channel edit limits. Text
+    that grows past 2000 chars spills into follow-up messages.
+    """
+
+    def __init__(self, channel, interval: float = EDIT_INTERVAL):
+        self.channel = channel
+        self.interval = interval
+        self.messages: list = []
+        self._shown: list[str] = []
+        self._want = ""
+        self._last = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def start(self, text: str = PLACEHOLDER):
+        self.messages = [await self.channel.send(text)]
+        self._shown = [text]
+        self._want = text
+        self._last = time.monotonic()
+
+    def update(self, text: str):
+        self._want = text
+        if self.messages and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        delay = reserve_edit(self.channel.id, self._last + self.interval, self.interval)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await self._apply(self._want)  # whatever is newest by now
+        except discord.HTTPException as e:
+            print("reply edit failed:", e)
+
+    async def _apply(self, text: str):
+        pages = split_message(text)
+        for i, page in enumerate(pages):
+            if i < len(self.messages):
+                if self._shown[i] != page:
+                    await self.messages[i].edit(content=page)
+                    self._shown[i] = page
+            else:
+                self.messages.append(await self.channel.send(page))
+                self._shown.append(page)
+        while len(self.messages) > len(pages):
+            self._shown.pop()
+            await self.messages.pop().delete()
+        self._last = time.monotonic()
+
+    async def finish(self, text: str):
+        self._want = text
+        if self._task is not None and not self._task.done():
+            await self._task
+        if not self.messages:
+            for page in split_message(text):
+                await self.channel.send(page)
+            return
+        if split_message(text) != self._shown:
+            delay = reserve_edit(self.channel.id, 0.0, self.interval)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self._apply(text)  # no-op for pages that are already current
+
+
 # --- Discord events ----------------------------------------------------------
 
 @bot.event
 async def on_ready():
     print(f"✅ Logged in as {bot.user} (id: {bot.user.id})")
     print("AGENT_URL =", repr(AGENT_URL))
+    if bot.shard_count:
+        print(f"Shards {sorted(getattr(bot, 'shards', {}) or [bot.shard_id])} of {bot.shard_count}")
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    print(f"Shard {shard_id} ready")
 
 @bot.event
 async def on_message(message: discord.Message):
     if message.author.bot:
         return
 
+    # a guild's events always arrive on the same shard; DMs come in on shard 0
+    shard_id = message.guild.shard_id if message.guild else 0
+    stats = shard_stats(shard_id)
+    stats.events += 1
     content = (message.content or "").strip()
 
     # Quick commands that don't hit the agent
@@ -263,27 +631,115 @@ async def on_message(message: discord.Message):
         await message.channel.send("pong 🏓")
         return
 
-    # Everything else → forward to agent
-    async with message.channel.typing():
-        result = await ask_agent(
-        content,
-        user_id=str(message.author.id),
-        conversation_id=str(message.channel.id),
+    if lower.startswith("!shards"):
+        await message.channel.send("\n".join(shard_report(reset=False)) or "no shards yet")
+        return
+
+    # Everything else → forward to agent (bounded; shed with a short reply when saturated)
+    guild_id = str(message.guild.id if message.guild else message.channel.id)
+    received = time.monotonic()
+    # post a placeholder right away (also while queued for a slot), then edit it as
+    # PLAN / picks / FINAL_RESPONSE stream in
+    live = LiveReply(message.channel)
+    await live.start()
+    try:
+        async with agent_gate(shard_id).slot(guild_id):
+            result = await ask_agent(
+                content,
+                user_id=str(message.author.id),
+                conversation_id=str(message.channel.id),
+                on_change=lambda reply: live.update(render_progress(reply)),
             )
-        plan_text = result["plan_text"] or "*working on it…*"
-        suggestions = format_links(result["links"], limit=5)
-
-        # Keep each message under Discord’s 2000-char limit
-        chunks = []
-        body = f"**Plan**\n{plan_text}\n\n**Suggestions**\n{suggestions}"
-        if len(body) <= 1900:
-            chunks = [body]
-        else:
-            # crude split if needed
-            mid = body.find("\n\n**Suggestions**")
-            chunks = [body[:mid], body[mid:]]
+            await live.finish(render_final(result))
+        stats.replies += 1
+        stats.latencies.append(time.monotonic() - received)
+    except AgentBusy:
+        await live.finish(BUSY_REPLY)
 
-        for c in chunks:
-            await message.channel.send(c)
 
-bot.run(TOKEN)
+async def main():
+    reporter = None
+    try:
+        if AGENT_MODE == "embedded":
+            await start_embedded_agent()
+        if SHARD_STATS_INTERVAL > 0:
+            reporter = asyncio.create_task(report_shard_stats())
+        async with bot:
+            await bot.start(TOKEN)
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        await close_agent_client()
+        await close_embedded_agent()
+
+
+def recommended_shards() -> tuple[int, int]:
+    """(shard count, identify max_concurrency) Discord recommends for this bot token."""
+    r = httpx.get("https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {TOKEN}"}, timeout=10)
+    r.raise_for_status()
+    data = r.json()
+    return int(data["shards"]), int(data.get("session_start_limit", {}).get("max_concurrency", 1))
+
+
+def run_shard_processes(procs: int):
+    """
+    Split the shards into `procs` contiguous slices and run one bot process per slice.
+
+    Children are started one after another, leaving them time to IDENTIFY
+    (Discord allows max_concurrency identifies per 5 s), restarted if they
+    exit, and stopped together on SIGINT/SIGTERM.
+    """
+    if DISCORD_SHARDS in ("", "auto"):
+        total, concurrency = recommended_shards()
+    else:
+        total, concurrency = int(DISCORD_SHARDS), 1
+    procs = max(1, min(procs, total))
+    per, extra = divmod(total, procs)
+    bounds = [i * per + min(i, extra) for i in range(procs + 1)]
+    slices = [list(range(bounds[i], bounds[i + 1])) for i in range(procs)]
+    print(f"Running {total} shards in {procs} processes: {slices}")
+
+    def spawn(ids: list[int]) -> subprocess.Popen:
+        env = {**os.environ, "DISCORD_SHARDS": str(total), "DISCORD_SHARD_IDS": ",".join(map(str, ids)),
+               "DISCORD_SHARD_PROCS": "1"}
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    children: list[subprocess.Popen | None] = [None] * procs
+    for i, ids in enumerate(slices):
+        if stopping:
+            break
+        children[i] = spawn(ids)
+        if i < procs - 1:
+            time.sleep(5.5 * math.ceil(len(ids) / concurrency))
+    while not stopping:
+        time.sleep(1)
+        for i, child in enumerate(children):
+            if child is not None and child.poll() is not None and not stopping:
+                print(f"Shard process {slices[i]} exited with {child.returncode}; restarting")
+                time.sleep(5)
+                children[i] = spawn(slices[i])
+    for child in children:
+        if child is not None and child.poll() is None:
+            child.send_signal(signal.SIGINT)
+    for child in children:
+        if child is not None:
+            try:
+                child.wait(30)
+            except subprocess.TimeoutExpired:
+                child.kill()
+
+
+if __name__ == "__main__":
+    discord.utils.setup_logging()
+    if DISCORD_SHARD_PROCS > 1 and not DISCORD_SHARD_IDS:
+        run_shard_processes(DISCORD_SHARD_PROCS)
+    else:
+        asyncio.run(main())
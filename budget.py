@@ -0,0 +1,33 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# absolute time.monotonic() by which the current request wants its answer; None = no budget.
+# A ContextVar, so tasks started while serving a request (fan-out lookups, playlist seeds) inherit it.
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def scope(seconds: float | None):
+    """Give the code inside at most `seconds` (never more than an enclosing budget allows)."""
+    if seconds is None or seconds <= 0:
+        yield
+        return
+    new = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(new if outer is None else min(outer, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current budget (may be <= 0); None if there is no budget."""
+    d = _deadline.get()
+    return None if d is None else d - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
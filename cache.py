@@ -0,0 +1,109 @@
+import time
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "stale_until", "size")
+
+    def __init__(self, value, expires: float, stale_until: float, size: int):
+        self.value = value
+        self.expires = expires
+        self.stale_until = stale_until
+        self.size = size
+
+
+class TTLCache:
+    """
+    In-memory LRU cache with a per-entry TTL and a stale window.
+
+    get() returns (value, fresh). Entries past their TTL but still inside the
+    stale window come back with fresh=False so the caller can answer right away
+    and refresh in the background. Entries past the stale window count as a
+    miss but are kept (peek() still sees them) until a new value replaces
+    them or LRU pushes them out. Both the entry count and the (approximate)
+    byte size are capped; the least recently used entries go first.
+    """
+
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, now: float | None = None):
+        e = self._data.get(key)
+        if e is None:
+            self.misses += 1
+            return None
+        now = time.monotonic() if now is None else now
+        if now >= e.stale_until:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        if now < e.expires:
+            self.hits += 1
+            return e.value, True
+        self.stale_hits += 1
+        return e.value, False
+
+    def peek(self, key):
+        """Value regardless of age (no stats, no LRU bump); None if absent."""
+        e = self._data.get(key)
+        return None if e is None else e.value
+
+    def ttl_left(self, key, now: float | None = None) -> float | None:
+        """Seconds until the entry stops being fresh (negative while stale); None if absent or expired."""
+        e = self._data.get(key)
+        now = time.monotonic() if now is None else now
+        if e is None or now >= e.stale_until:
+            return None
+        return e.expires - now
+
+    def set(self, key, value, ttl: float, stale: float = 0.0, size: int = 0):
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        if key in self._data:
+            if now >= self._data[key].stale_until:
+                self.expirations += 1
+            self._drop(key)
+        self._data[key] = _Entry(value, now + ttl, now + ttl + stale, size)
+        self._bytes += size
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            old_key = next(iter(self._data))
+            self._drop(old_key)
+            self.evictions += 1
+
+    def delete(self, key):
+        if key in self._data:
+            self._drop(key)
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+
+    def _drop(self, key):
+        e = self._data.pop(key)
+        self._bytes -= e.size
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
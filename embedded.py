@@ -0,0 +1,112 @@
+"""
+In-process agent for deployments where the bot and the agent share a box.
+
+Instead of POSTing to /assist and parsing SSE back, the bot calls
+MusicAgent.assist directly with an InMemoryResponseHandler, which hands
+each event to a dispatch(name, content) callback (bot.AgentReply.dispatch)
+as soon as the agent emits it. No JSON, no HTTP, no SSE framing.
+"""
+import itertools
+from types import SimpleNamespace
+
+from music_agent import MusicAgent
+
+_stream_ids = itertools.count(1)
+
+
+class InMemoryTextStream:
+    """StreamEventEmitter that forwards chunks straight to the dispatch callback."""
+
+    __slots__ = ("_dispatch", "_event_name", "_id", "_complete")
+
+    def __init__(self, dispatch, event_name: str):
+        self._dispatch = dispatch
+        self._event_name = event_name
+        self._id = f"stream-{next(_stream_ids)}"
+        self._complete = False
+
+    def id(self) -> str:
+        return self._id
+
+    def is_complete(self) -> bool:
+        return self._complete
+
+    async def emit_chunk(self, chunk: str):
+        if self._complete:
+            raise RuntimeError("Cannot emit chunk to closed stream.")
+        self._dispatch(self._event_name, chunk)
+
+    async def complete(self) -> None:
+        self._complete = True
+
+
+class InMemoryResponseHandler:
+    """
+    ResponseHandler that delivers events as (event_name, content) calls.
+
+    Mirrors what a client sees over SSE: text blocks and text-stream chunks
+    arrive as str, JSON events as the dict itself, errors as their message.
+    """
+
+    def __init__(self, dispatch):
+        self._dispatch = dispatch
+        self._streams: list[InMemoryTextStream] = []
+        self._complete = False
+
+    def _check(self):
+        if self._complete:
+            raise RuntimeError("Cannot send to a completed response handler.")
+
+    def respond(self, event_name: str, response) -> None:
+        self._check()
+        self._dispatch(event_name, response)
+        self._complete = True
+
+    async def emit_json(self, event_name: str, data) -> None:
+        self._check()
+        self._dispatch(event_name, data)
+
+    async def emit_text_block(self, event_name: str, content: str) -> None:
+        self._check()
+        self._dispatch(event_name, content)
+
+    def create_text_stream(self, event_name: str) -> InMemoryTextStream:
+        self._check()
+        stream = InMemoryTextStream(self._dispatch, event_name)
+        self._streams.append(stream)
+        return stream
+
+    async def emit_error(self, error_message: str, error_code: int = 500, details=None) -> None:
+        self._check()
+        self._dispatch("ERROR", error_message)
+
+    async def complete(self) -> None:
+        self._check()
+        for stream in self._streams:
+            await stream.complete()
+        self._complete = True
+
+    def is_complete(self) -> bool:
+        return self._complete
+
+
+class EmbeddedAgent:
+    """Owns one MusicAgent for the bot process; start()/close() wrap its lifecycle."""
+
+    def __init__(self, agent: MusicAgent | None = None):
+        self.agent = agent or MusicAgent()
+
+    async def start(self):
+        await self.agent.startup()
+
+    async def close(self):
+        await self.agent.shutdown()
+
+    async def assist(self, request: dict, dispatch):
+        """Run one request; `request` is the same {query, session} body the bot would POST to /assist."""
+        handler = InMemoryResponseHandler(dispatch)
+        await self.agent.assist(
+            SimpleNamespace(**request["session"]),
+            SimpleNamespace(**request["query"]),
+            handler,
+        )
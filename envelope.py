@@ -0,0 +1,51 @@
+"""The /assist request body, shared by the bot and the load generator."""
+import hashlib
+import os
+import time
+
+
+def new_ulid() -> str:
+    # ULID generator 
+    t = int(time.time() * 1000).to_bytes(6, "big")
+    r = os.urandom(10)
+    data = int.from_bytes(t + r, "big")
+    alphabet = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+    out = []
+    for _ in range(26):
+        out.append(alphabet[data & 31])
+        data >>= 5
+    return "".join(reversed(out))
+
+
+def conversation_ulid(conversation_id: str) -> str:
+    # stable ULID-shaped id per conversation (Discord channel), so the agent can
+    # remember what it already suggested there
+    data = int.from_bytes(hashlib.blake2b(conversation_id.encode(), digest_size=16).digest(), "big")
+    alphabet = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+    out = []
+    for _ in range(26):
+        out.append(alphabet[data & 31])
+        data >>= 5
+    return "".join(reversed(out))
+
+
+def assist_request(prompt: str, user_id: str | None = None, conversation_id: str | None = None,
+                   client: str = "discord-bot") -> dict:
+    """{query, session} body for POST /assist."""
+    session = {
+        "processor_id": new_ulid(),
+        "activity_id": conversation_ulid(conversation_id) if conversation_id else new_ulid(),
+        "request_id": new_ulid(),
+        "conversation_id": conversation_id or new_ulid(),
+        "client": client,
+        "interactions": [],
+    }
+    if user_id:
+        session["user_id"] = user_id
+    return {
+        "query": {
+            "id": new_ulid(),
+            "prompt": prompt
+        },
+        "session": session
+    }
@@ -0,0 +1,80 @@
+import asyncio
+import math
+from collections import deque
+
+
+class LatencyWindow:
+    """
+    The last `size` latencies of one kind of call, for picking a hedge delay.
+
+    percentile() sorts the window on demand (a few hundred floats), but is
+    only recomputed every `every` samples.
+    """
+
+    def __init__(self, size: int = 256, every: int = 16):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._every = every
+        self._since = 0
+        self._cached: dict[float, float] = {}
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self._since += 1
+        if self._since >= self._every:
+            self._since = 0
+            self._cached.clear()
+
+    def percentile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        value = self._cached.get(q)
+        if value is None:
+            ordered = sorted(self._samples)
+            value = self._cached[q] = ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)]
+        return value
+
+
+RECHECK = 0.1  # how often a callable delay is re-read while waiting
+
+
+async def hedged(call, delay):
+    """
+    Run call(False); if it hasn't finished after `delay` seconds, also run call(True)
+    and return (result, hedge_won) from whichever succeeds first.
+
+    `delay` is seconds, None (never hedge) or a callable returning either; a
+    callable is re-read while waiting, so a delay picked before any latencies
+    were known can still shrink. The loser is cancelled. An attempt that
+    raises doesn't end the race while the other is still running; if both
+    fail, the first attempt's error is raised.
+    """
+    tasks = [asyncio.create_task(call(False))]
+    try:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        while True:
+            d = delay() if callable(delay) else delay
+            if d is None:
+                return await tasks[0], False
+            left = started + d - loop.time()
+            if left <= 0:
+                break
+            done, _ = await asyncio.wait(tasks, timeout=min(left, RECHECK) if callable(delay) else left)
+            if done:
+                return tasks[0].result(), False
+        tasks.append(asyncio.create_task(call(True)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    return t.result(), t is tasks[1]
+        raise tasks[0].exception()
+    finally:
+        # cancel the loser; gather also marks finished attempts' errors as retrieved
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
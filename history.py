@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+from store import connect
+
+
+@lru_cache(maxsize=65536)  # pools are cached, so the same pairs get hashed on every request
+def track_hash(artist: str, title: str) -> int:
+    """Stable 64-bit id for an (artist, title) pair, case/whitespace-insensitive."""
+    key = f"{' '.join(artist.lower().split())}\x1f{' '.join(title.lower().split())}"
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class _Conversation:
+    __slots__ = ("order", "members", "touched")
+
+    def __init__(self, cap: int):
+        self.order: deque[int] = deque(maxlen=cap)
+        self.members: set[int] = set()
+        self.touched = time.monotonic()
+
+
+class ConversationHistory:
+    """
+    Recently served tracks per conversation, stored as 64-bit hashes.
+
+    Each conversation keeps at most `per_conversation` hashes (oldest dropped
+    first), at most `max_conversations` are kept (least recently active
+    dropped first), and conversations idle for `idle_ttl` seconds are
+    forgotten, so memory stays flat however many channels talk to the agent.
+    """
+
+    def __init__(self, per_conversation: int = 100, max_conversations: int = 10_000, idle_ttl: float = 6 * 3600):
+        self.per_conversation = per_conversation
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self._convs: OrderedDict[str, _Conversation] = OrderedDict()
+
+    def __len__(self):
+        return len(self._convs)
+
+    def _expire(self, now: float):
+        # least recently touched first, so stop at the first one still alive
+        while self._convs:
+            conv_id, conv = next(iter(self._convs.items()))
+            if now - conv.touched < self.idle_ttl and len(self._convs) <= self.max_conversations:
+                break
+            del self._convs[conv_id]
+
+    def seen(self, conv_id: str | None) -> set[int] | frozenset:
+        """Hashes recently served in this conversation (test with track_hash)."""
+        if not conv_id:
+            return frozenset()
+        conv = self._convs.get(conv_id)
+        if conv is None or time.monotonic() - conv.touched >= self.idle_ttl:
+            return frozenset()
+        return conv.members
+
+    def record(self, conv_id: str | None, tracks):
+        if not conv_id:
+            return
+        now = time.monotonic()
+        conv = self._convs.get(conv_id)
+        if conv is None or now - conv.touched >= self.idle_ttl:
+            conv = self._convs[conv_id] = _Conversation(self.per_conversation)
+        self._convs.move_to_end(conv_id)
+        conv.touched = now
+        for t in tracks:
+            h = track_hash(t["artist"], t["title"])
+            if h in conv.members:
+                continue
+            if len(conv.order) == conv.order.maxlen:
+                conv.members.discard(conv.order[0])
+            conv.order.append(h)
+            conv.members.add(h)
+        self._expire(now)
+
+    # same calls as SharedConversationHistory.aseen/arecord, so the agent can use either
+    async def aseen(self, conv_id: str | None) -> set[int] | frozenset:
+        return self.seen(conv_id)
+
+    async def arecord(self, conv_id: str | None, tracks):
+        self.record(conv_id, tracks)
+
+
+def _signed(h: int) -> int:
+    return h - (1 << 64) if h >= 1 << 63 else h  # SQLite integers are signed 64-bit
+
+
+class SharedConversationHistory:
+    """
+    ConversationHistory kept in a SQLite file, so every worker process sees the same history.
+
+    Same interface and limits as ConversationHistory: one row per served
+    track, the newest `per_conversation` kept per conversation, and a
+    conversation whose last record is older than `idle_ttl` counts as empty.
+    The `max_conversations` cap and idle cleanup run every `compact_every`
+    records. From async code use aseen()/arecord(): they run on a worker
+    thread, since a write can wait up to busy_timeout on another worker's
+    lock, and a SQLite error just means no history for that request.
+    """
+
+    def __init__(self, path: str, per_conversation: int = 100, max_conversations: int = 10_000,
+                 idle_ttl: float = 6 * 3600, compact_every: int = 500):
+        self.path = path
+        self.per_conversation = per_conversation
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self.compact_every = compact_every
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _db(self):
+        if self._conn is None:
+            conn = connect(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                " seq INTEGER PRIMARY KEY, conv TEXT NOT NULL, h INTEGER NOT NULL, at REAL NOT NULL,"
+                " UNIQUE (conv, h))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS history_conv ON history(conv, seq)")
+            self._conn = conn
+        return self._conn
+
+    def __len__(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(DISTINCT conv) FROM history").fetchone()[0]
+
+    def seen(self, conv_id: str | None) -> set[int] | frozenset:
+        """Hashes recently served in this conversation (test with track_hash)."""
+        if not conv_id:
+            return frozenset()
+        with self._lock:
+            rows = self._db().execute("SELECT h, at FROM history WHERE conv = ?", (conv_id,)).fetchall()
+        if not rows or time.time() - max(at for _, at in rows) >= self.idle_ttl:
+            return frozenset()
+        return {h % (1 << 64) for h, _ in rows}
+
+    def record(self, conv_id: str | None, tracks):
+        if not conv_id:
+            return
+        now = time.time()
+        hashes = [(conv_id, _signed(track_hash(t["artist"], t["title"])), now) for t in tracks]
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                last = db.execute("SELECT MAX(at) FROM history WHERE conv = ?", (conv_id,)).fetchone()[0]
+                if last is not None and now - last >= self.idle_ttl:
+                    db.execute("DELETE FROM history WHERE conv = ?", (conv_id,))
+                # already-heard tracks keep their place, like ConversationHistory
+                db.executemany("INSERT OR IGNORE INTO history (conv, h, at) VALUES (?, ?, ?)", hashes)
+                db.execute("UPDATE history SET at = ? WHERE conv = ?", (now, conv_id))
+                db.execute(
+                    "DELETE FROM history WHERE conv = ? AND seq NOT IN ("
+                    " SELECT seq FROM history WHERE conv = ? ORDER BY seq DESC LIMIT ?)",
+                    (conv_id, conv_id, self.per_conversation),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self._writes += 1
+            if self._writes % self.compact_every == 0:
+                self._compact(now)
+
+    async def aseen(self, conv_id: str | None) -> set[int] | frozenset:
+        try:
+            return await asyncio.to_thread(self.seen, conv_id)
+        except sqlite3.Error as e:
+            print("History lookup failed, carrying on without it:", e)
+            return frozenset()
+
+    async def arecord(self, conv_id: str | None, tracks):
+        try:
+            await asyncio.to_thread(self.record, conv_id, list(tracks))
+        except sqlite3.Error as e:
+            print("Could not record history:", e)
+
+    def _compact(self, now: float):
+        db = self._db()
+        db.execute("DELETE FROM history WHERE at < ?", (now - self.idle_ttl,))
+        db.execute(
+            "DELETE FROM history WHERE conv IN ("
+            " SELECT conv FROM history GROUP BY conv ORDER BY MAX(at) DESC LIMIT -1 OFFSET ?)",
+            (self.max_conversations,),
+        )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
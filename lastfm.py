@@ -1,135 +1,627 @@
 import os
+import time
+import asyncio
 import httpx
 import random                          
-from urllib.parse import quote_plus
+from contextlib import aclosing
 from dotenv import load_dotenv
 
+from cache import TTLCache
+from store import PoolStore
+from ratelimit import SharedTokenBucket, TokenBucket
+from artist_index import ArtistIndex
+import budget
+from hedge import LatencyWindow, hedged
+from history import track_hash
+from track import Track
+from metrics import (
+    BUDGET_TIMEOUTS, CACHE_LOOKUPS, LASTFM_ERRORS, LASTFM_GAVE_UP, LASTFM_HEDGES, LASTFM_RETRIES_TOTAL, LASTFM_SECONDS,
+    register_collector,
+)
+
 load_dotenv()
 
 LASTFM_API_KEY = os.getenv("LASTFM_API_KEY")
 BASE = "https://ws.audioscrobbler.com/2.0/"
 
+# connection pool for ws.audioscrobbler.com (shared by every helper below)
+LASTFM_TIMEOUT = float(os.getenv("LASTFM_TIMEOUT", "15"))
+LASTFM_MAX_CONNECTIONS = int(os.getenv("LASTFM_MAX_CONNECTIONS", "20"))
+LASTFM_MAX_KEEPALIVE = int(os.getenv("LASTFM_MAX_KEEPALIVE", "10"))
+LASTFM_KEEPALIVE_EXPIRY = float(os.getenv("LASTFM_KEEPALIVE_EXPIRY", "30"))
+LASTFM_HTTP2 = os.getenv("LASTFM_HTTP2", "").lower() in {"1", "true", "yes"}
+# max concurrent artist.gettoptracks lookups per "like <artist>" request
+LASTFM_FANOUT = int(os.getenv("LASTFM_FANOUT", "6"))
+
+# response cache (keyed on normalized method+params); TTLs in seconds per method
+LASTFM_CACHE_ENTRIES = int(os.getenv("LASTFM_CACHE_ENTRIES", "2000"))
+LASTFM_CACHE_MB = float(os.getenv("LASTFM_CACHE_MB", "64"))
+LASTFM_CACHE_STALE = float(os.getenv("LASTFM_CACHE_STALE", "600"))  # serve stale this long while refreshing
+CACHE_TTLS = {
+    "tag.gettoptracks": 3600,
+    "track.search": 1800,
+    "artist.search": 24 * 3600,
+    "artist.getsimilar": 6 * 3600,
+    "artist.gettoptracks": 3600,
+}
+
+# optional on-disk store of normalized pools (tag/artist top tracks, similar artists, resolved names)
+LASTFM_STORE_PATH = os.getenv("LASTFM_STORE_PATH", "").strip()
+LASTFM_STORE_MAX_ROWS = int(os.getenv("LASTFM_STORE_MAX_ROWS", "50000"))
+
+# client-side rate limit shared by every Last.fm call, plus retry/backoff for transient errors
+LASTFM_RPS = float(os.getenv("LASTFM_RPS", "5"))  # 0 disables the limiter
+LASTFM_BURST = int(os.getenv("LASTFM_BURST", "10"))
+LASTFM_RETRIES = int(os.getenv("LASTFM_RETRIES", "3"))
+LASTFM_BACKOFF_BASE = float(os.getenv("LASTFM_BACKOFF_BASE", "0.25"))
+LASTFM_BACKOFF_MAX = float(os.getenv("LASTFM_BACKOFF_MAX", "4"))
+LASTFM_DEADLINE = float(os.getenv("LASTFM_DEADLINE", "20"))  # per request, queueing + retries included
+# hedging: a request still unanswered after the method's recent p95 latency gets a duplicate, first answer wins
+LASTFM_HEDGE = os.getenv("LASTFM_HEDGE", "1") != "0"
+LASTFM_HEDGE_PERCENTILE = float(os.getenv("LASTFM_HEDGE_PERCENTILE", "95"))
+LASTFM_HEDGE_MIN = float(os.getenv("LASTFM_HEDGE_MIN", "0.05"))  # seconds; hedge delay clamp
+LASTFM_HEDGE_MAX = float(os.getenv("LASTFM_HEDGE_MAX", "3"))     # also the delay until enough latencies are known
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_ERRORS = {8, 11, 16, 29}  # operation failed, service offline, temporary error, rate limit exceeded
+
+# multi-worker mode: SQLite file holding the rate-limit budget (and conversation history) for every
+# worker on this host; music_agent sets it when AGENT_WORKERS > 1
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "").strip()
+
+# when a conversation has already heard most of a pool, refetch it this many times larger (once)
+LASTFM_WIDEN_FACTOR = float(os.getenv("LASTFM_WIDEN_FACTOR", "2.5"))
+
+# local fuzzy index of every artist name seen so far; resolve_artist only goes to the network on a miss
+LASTFM_ARTIST_SEED = os.getenv("LASTFM_ARTIST_SEED", "").strip()  # optional file, one name per line
+LASTFM_ARTIST_INDEX_MAX = int(os.getenv("LASTFM_ARTIST_INDEX_MAX", "100000"))  # least recently used names go first
+
+_client: httpx.AsyncClient | None = None
+_artist_index = ArtistIndex(max_names=LASTFM_ARTIST_INDEX_MAX)
+_limiter = (SharedTokenBucket(SHARED_STATE_PATH, LASTFM_RPS, LASTFM_BURST) if SHARED_STATE_PATH
+            else TokenBucket(LASTFM_RPS, LASTFM_BURST))
+_retries = 0
+_gave_up = 0
+_last_give_up = float("-inf")  # monotonic time of the last fetch we gave up on
+_store = PoolStore(LASTFM_STORE_PATH, max_rows=LASTFM_STORE_MAX_ROWS) if LASTFM_STORE_PATH else None
+_cache = TTLCache(LASTFM_CACHE_ENTRIES, int(LASTFM_CACHE_MB * 1024 * 1024))
+# normalized pools read back from the store, so a warm store costs one SQLite read per key, not one per call
+_pools = TTLCache(LASTFM_CACHE_ENTRIES, int(LASTFM_CACHE_MB * 1024 * 1024))
+_latencies: dict[str, LatencyWindow] = {}  # per method, for the hedge delay
+_all_latencies = LatencyWindow()            # every method, until one has enough samples of its own
+_inflight: dict[tuple, asyncio.Task] = {}  # single-flight: one upstream fetch per key at a time
+_coalesced = 0
+
+
+def _make_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    http2 = LASTFM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401  (httpx[http2] extra)
+        except ImportError:
+            print("LASTFM_HTTP2 set but 'h2' is not installed; using HTTP/1.1.")
+            http2 = False
+    limits = httpx.Limits(
+        max_connections=LASTFM_MAX_CONNECTIONS,
+        max_keepalive_connections=LASTFM_MAX_KEEPALIVE,
+        keepalive_expiry=LASTFM_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(timeout=LASTFM_TIMEOUT, limits=limits, http2=http2, transport=transport)
+
+
+def get_client() -> httpx.AsyncClient:
+    """Process-wide Last.fm client; created lazily if startup() was never called."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _make_client()
+    return _client
+
+
+async def startup(transport: httpx.AsyncBaseTransport | None = None):
+    """Open the shared client (call once when the agent process starts)."""
+    global _client
+    if LASTFM_ARTIST_SEED and not len(_artist_index):
+        try:
+            n = await asyncio.to_thread(_artist_index.load, LASTFM_ARTIST_SEED)
+            print(f"Artist index seeded with {n} names from {LASTFM_ARTIST_SEED}")
+        except OSError as e:
+            print("Could not seed artist index:", e)
+    if _client is not None and not _client.is_closed:
+        if transport is None:
+            return
+        await _client.aclose()
+    _client = _make_client(transport)
+
+
+async def shutdown():
+    """Close the shared client and its pooled connections."""
+    global _client
+    for task in list(_inflight.values()):
+        task.cancel()
+    client, _client = _client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+    if _store is not None:
+        _store.close()
+    if isinstance(_limiter, SharedTokenBucket):
+        _limiter.close()
+
+
+def _cache_key(params: dict) -> tuple:
+    # Last.fm treats names/tags case-insensitively, so "Chill" and " chill" share an entry
+    return tuple(sorted((k, " ".join(str(v).lower().split())) for k, v in params.items()))
+
+
+class LastFMError(Exception):
+    """Transient Last.fm failure (HTTP 429/5xx or an API error code worth retrying)."""
+
+    def __init__(self, message: str, status: int | None = None, code: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.retry_after = retry_after
+
+
+def upstream_stats() -> dict:
+    return {"limiter": _limiter.stats(), "retries": _retries, "gave_up": _gave_up}
+
+
+def upstream_failing(window: float) -> bool:
+    """True if some fetch ran out of retries in the last `window` seconds."""
+    return time.monotonic() - _last_give_up < window
+
+
+def cache_stats() -> dict:
+    stats = _cache.stats()
+    stats["coalesced"] = _coalesced
+    stats["artist_index"] = _artist_index.stats()
+    if _store is not None:
+        stats["store"] = _store.stats()
+        stats["store_pools"] = _pools.stats()
+    return stats
+
+
+@register_collector
+def _gauges():
+    stats = _cache.stats()
+    return [
+        ("musicagent_cache_entries", "Entries in the Last.fm response cache.", stats["entries"]),
+        ("musicagent_cache_bytes", "Approximate bytes held by the Last.fm response cache.", stats["bytes"]),
+        ("musicagent_cache_evictions_total", "Entries evicted from the Last.fm response cache to stay under its caps.",
+         stats["evictions"], "counter"),
+        ("musicagent_lastfm_inflight", "Distinct Last.fm fetches in flight.", len(_inflight)),
+        ("musicagent_limiter_tokens", "Tokens currently available in the Last.fm rate limiter.", _limiter.available()),
+    ]
+
+
+def _error_kind(e: Exception) -> str:
+    if isinstance(e, LastFMError):
+        return f"api_{e.code}" if e.code is not None else f"http_{e.status}"
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"http_{e.response.status_code}"
+    return "transport"
+
+
+def _check(r: httpx.Response):
+    """Return the JSON body, raising LastFMError for anything worth retrying."""
+    try:
+        data = r.json()
+    except ValueError:
+        data = None
+    code = data.get("error") if isinstance(data, dict) else None
+    if r.status_code in RETRY_STATUS or code in RETRY_ERRORS:
+        retry_after = r.headers.get("retry-after")
+        raise LastFMError(
+            f"Last.fm {r.request.url.params.get('method', '?')} failed: HTTP {r.status_code}, error {code}",
+            status=r.status_code, code=code,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+        )
+    r.raise_for_status()
+    return data
+
+
+def _hedge_delay(method: str) -> float | None:
+    if not LASTFM_HEDGE:
+        return None
+    window = _latencies.get(method)
+    if window is None or len(window) < 20:
+        window = _all_latencies
+    p = window.percentile(LASTFM_HEDGE_PERCENTILE) if len(window) >= 20 else None
+    return LASTFM_HEDGE_MAX if p is None else min(LASTFM_HEDGE_MAX, max(LASTFM_HEDGE_MIN, p))
+
+
+async def _fetch(key: tuple, params: dict):
+    global _retries, _gave_up, _last_give_up
+    # the fetch's own deadline, not the caller's budget: the result is shared and cached
+    deadline = time.monotonic() + LASTFM_DEADLINE
+    method = params.get("method", "?")
+    window = _latencies.setdefault(method, LatencyWindow())
+
+    async def send(hedge: bool):
+        if hedge:
+            # a hedge only goes out on a spare token; otherwise the original keeps going alone
+            if _limiter.rate > 0 and _limiter.available() < 1:
+                raise TimeoutError("no limiter token to spare for a hedge")
+            await _limiter.acquire(timeout=0)
+            LASTFM_HEDGES.inc(method, "sent")
+        started = time.perf_counter()
+        try:
+            r = await get_client().get(
+                BASE,
+                params={**params, "api_key": LASTFM_API_KEY, "format": "json"},
+                timeout=max(0.1, min(LASTFM_TIMEOUT, deadline - time.monotonic())),
+            )
+        finally:
+            LASTFM_SECONDS.observe(time.perf_counter() - started, method)
+        window.add(time.perf_counter() - started)
+        _all_latencies.add(time.perf_counter() - started)
+        return r, _check(r)
+
+    attempt = 0
+    while True:
+        await _limiter.acquire(timeout=deadline - time.monotonic())
+        try:
+            (r, data), hedge_won = await hedged(send, lambda: _hedge_delay(method))
+            if hedge_won:
+                LASTFM_HEDGES.inc(method, "won")
+            break
+        except httpx.HTTPStatusError as e:
+            LASTFM_ERRORS.inc(method, _error_kind(e))
+            raise
+        except (httpx.TransportError, LastFMError) as e:
+            LASTFM_ERRORS.inc(method, _error_kind(e))
+            attempt += 1
+            # full jitter; honour Retry-After when Last.fm sends one
+            delay = random.uniform(0, min(LASTFM_BACKOFF_MAX, LASTFM_BACKOFF_BASE * 2 ** attempt))
+            if isinstance(e, LastFMError) and e.retry_after is not None:
+                delay = max(delay, e.retry_after)
+            if attempt > LASTFM_RETRIES or time.monotonic() + delay >= deadline:
+                _gave_up += 1
+                LASTFM_GAVE_UP.inc(method)
+                _last_give_up = time.monotonic()
+                raise
+            _retries += 1
+            LASTFM_RETRIES_TOTAL.inc(method)
+            await asyncio.sleep(delay)
+    ttl = CACHE_TTLS.get(method)
+    # don't cache Last.fm error payloads ({"error": 6, "message": ...})
+    if isinstance(data, dict) and "error" in data:
+        LASTFM_ERRORS.inc(method, f"api_{data['error']}")
+    elif ttl and isinstance(data, dict):
+        _cache.set(key, data, ttl, LASTFM_CACHE_STALE, size=len(r.content))
+    return data
+
+
+def _shared_fetch(key: tuple, params: dict) -> asyncio.Task:
+    """Join the in-flight fetch for key, or start one that every concurrent caller shares."""
+    global _coalesced
+    task = _inflight.get(key)
+    if task is not None:
+        _coalesced += 1
+        return task
+    task = asyncio.create_task(_fetch(key, params))
+    _inflight[key] = task
+
+    def _done(t: asyncio.Task):
+        if _inflight.get(key) is t:
+            del _inflight[key]
+        if not t.cancelled():
+            t.exception()  # waiters still see the error; this just marks it retrieved
+
+    task.add_done_callback(_done)
+    return task
+
 
 async def _get_json(params: dict):
+    """Cached Last.fm response; waits for the network at most as long as the request's budget allows."""
+    if not LASTFM_API_KEY:
+        return None
+    key = _cache_key(params)
+    too_old = _cache.peek(key)  # past the stale window, but better than nothing if the budget runs out
+    hit = _cache.get(key)
+    if hit is not None:
+        data, fresh = hit
+        if not fresh:
+            _shared_fetch(key, params)  # stale-while-revalidate: answer now, refresh behind
+        CACHE_LOOKUPS.inc("hit" if fresh else "stale")
+        return data
+    CACHE_LOOKUPS.inc("coalesced" if key in _inflight else "miss")
+    task = _shared_fetch(key, params)
+    left = budget.remaining()
+    if left is None:
+        # shield: a cancelled caller must not cancel the fetch other callers are waiting on
+        return await asyncio.shield(task)
+    # asyncio.wait leaves the fetch running when we give up, so it still lands in the cache
+    await asyncio.wait({task}, timeout=max(0.0, left))
+    if task.done():
+        return task.result()
+    BUDGET_TIMEOUTS.inc(params.get("method", "?"), "none" if too_old is None else "expired_cache")
+    if too_old is not None:
+        return too_old
+    raise TimeoutError(f"latency budget spent waiting for {params.get('method')}")
+
+
+def fresh_for(params: dict) -> float | None:
+    """Seconds the cached response for params stays fresh (negative = stale); None if not cached."""
+    return _cache.ttl_left(_cache_key(params))
+
+
+async def refresh(params: dict, normalize=None):
+    """Fetch params now and re-cache it, even if a fresh copy is cached (used by the prefetcher).
+
+    With `normalize`, the pool also goes to the on-disk store, where other workers pick it up.
+    """
     if not LASTFM_API_KEY:
         return None
-    params = {**params, "api_key": LASTFM_API_KEY, "format": "json"}
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.get(BASE, params=params)
-        r.raise_for_status()
-        return r.json()
-def _yt_link(artist: str, title: str):
-    return f"https://www.youtube.com/results?search_query={quote_plus((artist+' '+title).strip())}"
-
-def _pick_k(items: list[dict], k: int) -> list[dict]:
+    key = _cache_key(params)
+    data = await asyncio.shield(_shared_fetch(key, params))
+    if normalize is not None and _store is not None:
+        value = normalize(data)
+        if value:
+            await _store.aput(_store_key(key), value, CACHE_TTLS.get(params["method"], 3600))
+    return data
+
+
+def tag_pool_params(tag: str, pool: int = 40) -> dict:
+    return {"method": "tag.gettoptracks", "tag": tag, "limit": str(pool)}
+
+def _pick_k(items: list, k: int, seen=None, pair=tuple) -> list:
+    """Random k from a pool; with `seen` (track hashes), unseen items are used up first.
+
+    `items` are raw pool entries (often the cached list itself, so it is never
+    shuffled in place); `pair(item)` gives its (artist, title) for the seen check.
+    """
     if not items:
         return []
-    if len(items) <= k:
-        random.shuffle(items)
+    if seen:
+        fresh, stale = [], []
+        for i in items:
+            (stale if track_hash(*pair(i)) in seen else fresh).append(i)
+        if stale:
+            picks = _pick_k(fresh, k)
+            return picks + _pick_k(stale, k - len(picks)) if len(picks) < k else picks
+    return random.sample(items, min(k, len(items)))
+
+def _runs_dry(items: list, k: int, seen, pair=tuple) -> bool:
+    """True if the conversation has already heard all but fewer than k of these items."""
+    if not seen:
+        return False
+    return sum(1 for i in items if track_hash(*pair(i)) not in seen) < k
+
+def _wider(pool: int) -> int:
+    return max(pool + 1, int(pool * LASTFM_WIDEN_FACTOR))
+
+async def _widen(fetch, items: list) -> list:
+    """The wider pool, or the one we already have if it can't be fetched (e.g. the budget ran out)."""
+    if budget.expired():
+        fetch.close()
+        return items
+    try:
+        return await fetch or items
+    except Exception:
         return items
-    return random.sample(items, k)
+
+def _store_key(key: tuple) -> str:
+    return "|".join(f"{k}={v}" for k, v in key)
+
+async def _pooled(params: dict, normalize, artists=None):
+    """_get_json + normalize, backed by the on-disk store when the memory cache is cold.
+
+    `artists(value)` lists the artist names in the pool so they land in the local artist index.
+    """
+    key = _cache_key(params)
+    if _store is None or _cache.ttl_left(key) is not None:
+        value = normalize(await _get_json(params))
+    elif (hit := _pools.get(key)) is not None:
+        value, fresh = hit
+        if not fresh:
+            _shared_fetch(key, params)  # stale-while-revalidate; the refreshed response lands in _cache
+    else:
+        skey = _store_key(key)
+        entry = await _store.aget_entry(skey)
+        if entry is not None:
+            value, ttl_left, size = entry
+            _pools.set(key, value, ttl_left, LASTFM_CACHE_STALE, size=size)
+        else:
+            value = normalize(await _get_json(params))
+            if value:
+                await _store.aput(skey, value, CACHE_TTLS.get(params["method"], 3600))
+    if artists is not None and value:
+        _artist_index.add_many(artists(value))
+    return value
+
+def _norm_resolved(data) -> str | None:
+    matches = (data or {}).get("results", {}).get("artistmatches", {}).get("artist", []) or []
+    # Last.fm returns canonical name in 'name'
+    return matches[0].get("name") if matches else None
+
+def _norm_tag_pool(data) -> list[list[str]]:
+    tracks = (data or {}).get("tracks", {}).get("track", []) or []
+    return [[t.get("artist", {}).get("name", ""), t.get("name", "")] for t in tracks]
+
+def _norm_top_titles(data) -> list[str]:
+    tracks = (data or {}).get("toptracks", {}).get("track", []) or []
+    return [t.get("name", "") for t in tracks]
+
+def _norm_track_matches(data) -> list[list[str]]:
+    matches = (data or {}).get("results", {}).get("trackmatches", {}).get("track", []) or []
+    return [[t.get("artist", "Unknown"), t.get("name", "Unknown")] for t in matches]
+
+def _norm_similar(data) -> list[str]:
+    sims = (data or {}).get("similarartists", {}).get("artist", []) or []
+    return [a.get("name") for a in sims if a.get("name")]
+
+async def tag_pool(tag: str, pool: int = 40) -> list[list[str]]:
+    """[[artist, title], ...] for tag.getTopTracks."""
+    return await _pooled(tag_pool_params(tag, pool), _norm_tag_pool,
+                         artists=lambda v: (a for a, _ in v))
+
+async def artist_top_pool(artist: str, pool: int = 25) -> list[str]:
+    """Top track titles for an (already resolved) artist."""
+    return await _pooled({"method": "artist.gettoptracks", "artist": artist, "limit": str(pool)}, _norm_top_titles)
+
+async def track_search_pool(query: str, limit: int = 30) -> list[list[str]]:
+    """[[artist, title], ...] for track.search (memory cache only; searches are too varied for the store)."""
+    return _norm_track_matches(await _get_json({"method": "track.search", "track": query, "limit": str(limit)}))
+
+async def similar_artists(artist: str, limit: int = 20) -> list[str]:
+    return await _pooled({"method": "artist.getsimilar", "artist": artist, "limit": str(limit)}, _norm_similar,
+                         artists=lambda v: v)
 
 async def resolve_artist(name: str) -> str | None:
+    # confident local match (exact or close misspelling) skips the artist.search round trip
+    local = _artist_index.lookup(name)
+    if local:
+        return local
     try:
-        data = await _get_json({"method": "artist.search", "artist": name, "limit": "1"})
-        matches = (data or {}).get("results", {}).get("artistmatches", {}).get("artist", []) or []
-        if matches:
-            # Last.fm returns canonical name in 'name'
-            return matches[0].get("name")
-        return None
+        return await _pooled({"method": "artist.search", "artist": name, "limit": "1"}, _norm_resolved,
+                             artists=lambda v: [v])
     except Exception:
         return None
 
-async def recommend_by_tag(tag: str, k: int, pool: int = 40):     
+def _unknown_pair(item) -> tuple[str, str]:
+    return item[0] or "Unknown", item[1] or "Unknown"
+
+# sample from the cached pool first, then build Track objects for the k picks only
+async def recommend_by_tag(tag: str, k: int, pool: int = 40, seen=None) -> list[Track]:
     try:
-        data = await _get_json({"method": "tag.gettoptracks", "tag": tag, "limit": str(pool)})
-        tracks = (data or {}).get("tracks", {}).get("track", []) or []
-        items = [
-            {"artist": t.get("artist", {}).get("name", "Unknown"),
-             "title": t.get("name", "Unknown"),
-             "youtube": _yt_link(t.get("artist", {}).get("name",""), t.get("name",""))}
-            for t in tracks
-        ]
-        return _pick_k(items, k)
+        items = await tag_pool(tag, pool)
+        if _runs_dry(items, k, seen, _unknown_pair):
+            items = await _widen(tag_pool(tag, _wider(pool)), items)
+        return [Track(*_unknown_pair(i)) for i in _pick_k(items, k, seen, _unknown_pair)]
     except Exception:
         return []
 
-async def recommend_by_track_search(query: str, k: int, pool: int = 30):
+async def recommend_by_track_search(query: str, k: int, pool: int = 30, seen=None) -> list[Track]:
     try:
-        data = await _get_json({"method": "track.search", "track": query, "limit": str(pool)})
-        matches = (data or {}).get("results", {}).get("trackmatches", {}).get("track", []) or []
-        items = [
-            {"artist": t.get("artist", "Unknown"),
-             "title": t.get("name", "Unknown"),
-             "youtube": _yt_link(t.get("artist",""), t.get("name",""))}
-            for t in matches
-        ]
-        return _pick_k(items, k)
+        items = await track_search_pool(query, pool)
+        if _runs_dry(items, k, seen):
+            items = await _widen(track_search_pool(query, _wider(pool)), items)
+        return [Track(a, t) for a, t in _pick_k(items, k, seen)]
     except Exception:
         return []
 
-async def recommend_similar_to_artist(artist: str, k: int, pool_artists: int = 20):
-    artist = await resolve_artist(artist) or artist
-    """artist.getSimilar → sample similar artists → take 1 top track from each until k."""
+async def _one_top_track(name: str, seen=None) -> tuple[Track, bool] | None:
+    """(track, fresh) for one similar artist; fresh is False if the conversation already heard it."""
+    top = await artist_top_pool(name, 3)  # small pool
+    if not top:
+        return None
+    # pick one random top track for this similar artist, preferring ones not served yet
+    fresh = [t for t in top if not seen or track_hash(name, t or "Unknown") not in seen]
+    title = random.choice(fresh or top) or "Unknown"
+    return Track(name, title), bool(fresh)
+
+async def _fan_out_top_tracks(names: list[str], want: int, seen=None):
+    """Yield (track, fresh) per artist as lookups finish, in parallel but only as many as could still be needed.
+
+    At most min(LASTFM_FANOUT, want - fresh tracks yielded so far) lookups are
+    outstanding; the next artist is only tried when one fails, comes back empty
+    or has nothing the conversation hasn't heard. Lookups run shielded, so a
+    lookup we start is paid for even if we stop waiting for it.
+    """
+    queue = iter(names)
+    pending: set[asyncio.Task] = set()
+    need = want
     try:
-        data = await _get_json({"method": "artist.getsimilar", "artist": artist, "limit": str(pool_artists)})
-        sims = (data or {}).get("similarartists", {}).get("artist", []) or []
-        random.shuffle(sims)  # vary which similar artists we use
-        results = []
-        async with httpx.AsyncClient(timeout=15) as client:
-            for a in sims:
-                name = a.get("name")
-                if not name:
+        while True:
+            while len(pending) < min(max(1, LASTFM_FANOUT), need):
+                name = next(queue, None)
+                if name is None:
+                    break
+                pending.add(asyncio.create_task(_one_top_track(name, seen)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is not None:
                     continue
-                try:
-                    r = await client.get(
-                        BASE,
-                        params={"method":"artist.gettoptracks", "artist": name, "limit":"3",   # small pool
-                                "api_key": LASTFM_API_KEY, "format":"json"}
-                    )
-                    r.raise_for_status()
-                    top = (r.json().get("toptracks", {}).get("track", []) or [])
-                    if top:
-                        # pick one random top track for this similar artist
-                        choice = random.choice(top)
-                        title = choice.get("name", "Unknown")
-                        results.append({"artist": name, "title": title, "youtube": _yt_link(name, title)})
-                        if len(results) >= k:
-                            break
-                except Exception:
+                item = t.result()
+                if item:
+                    need -= item[1]
+                    yield item
+    finally:
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+async def iter_similar_to_artist(artist: str, k: int, pool_artists: int = 20, seen=None):
+    """artist.getSimilar → sample similar artists → yield 1 top track from each as it arrives, until k.
+
+    Lookups run concurrently, but no more than are still needed to reach k. With `seen`, tracks the
+    conversation already heard are held back and the similar-artist list is widened once
+    before falling back to them. If the request's budget runs out, whatever was found so
+    far is what you get.
+    """
+    artist = await resolve_artist(artist) or artist
+    try:
+        names = list(await similar_artists(artist, pool_artists))
+    except Exception:
+        return
+    random.shuffle(names)  # vary which similar artists we use
+    found, held_back = 0, []
+    for widened in (False, True):
+        if widened:
+            if not seen or found >= k or budget.expired():
+                break
+            try:
+                tried = set(names)
+                names = [n for n in await similar_artists(artist, _wider(pool_artists)) if n not in tried]
+            except Exception:
+                break
+            random.shuffle(names)
+        async with aclosing(_fan_out_top_tracks(names, k - found, seen)) as picks:
+            async for item, fresh in picks:
+                if not fresh:
+                    held_back.append(item)
                     continue
-        return results
+                yield item
+                found += 1
+                if found >= k:
+                    return
+    for item in held_back[:k - found]:
+        yield item
+
+async def recommend_similar_to_artist(artist: str, k: int, pool_artists: int = 20, seen=None):
+    try:
+        return [t async for t in iter_similar_to_artist(artist, k, pool_artists, seen)]
     except Exception:
         return []
 
-async def recommend_artist_top(artist: str, k: int, pool: int = 25):
+async def recommend_artist_top(artist: str, k: int, pool: int = 25, seen=None) -> list[Track]:
     artist = await resolve_artist(artist) or artist
+    def pair(title):
+        return artist, title or "Unknown"
     try:
-        data = await _get_json({"method": "artist.gettoptracks", "artist": artist, "limit": str(pool)})
-        tracks = (data or {}).get("toptracks", {}).get("track", []) or []
-        items = [
-            {"artist": artist,
-             "title": t.get("name", "Unknown"),
-             "youtube": _yt_link(artist, t.get("name",""))}
-            for t in tracks
-        ]
-        return _pick_k(items, k)
+        items = await artist_top_pool(artist, pool)
+        if _runs_dry(items, k, seen, pair):
+            items = await _widen(artist_top_pool(artist, _wider(pool)), items)
+        return [Track(*pair(t)) for t in _pick_k(items, k, seen, pair)]
     except Exception:
         return []
 
-async def get_tracks_for_intent(parsed, limit: int = 5):
-    """Randomized selection from a larger pool for variety."""
+async def get_tracks_for_intent(parsed, limit: int = 5, seen=None):
+    """Randomized selection from a larger pool for variety (skipping tracks in `seen` when possible)."""
     if not LASTFM_API_KEY:
         return []
     match parsed.intent:
         case "vibe" | "mood":
-            return await recommend_by_tag(parsed.vibe, k=limit, pool=40)
+            return await recommend_by_tag(parsed.vibe, k=limit, pool=40, seen=seen)
         case "track":
             q = f"{parsed.artist} {parsed.title}".strip() if parsed.artist and parsed.title else (parsed.title or "")
-            return await recommend_by_track_search(q, k=limit, pool=30)
+            return await recommend_by_track_search(q, k=limit, pool=30, seen=seen)
         case "artist_like":
-            return await recommend_similar_to_artist(parsed.artist, k=limit, pool_artists=20)
+            return await recommend_similar_to_artist(parsed.artist, k=limit, pool_artists=20, seen=seen)
         case "artist_top":
-            return await recommend_artist_top(parsed.artist, k=limit, pool=25)
+            return await recommend_artist_top(parsed.artist, k=limit, pool=25, seen=seen)
         case _:
-            return await recommend_by_track_search(parsed.title or "", k=limit, pool=30)
\ No newline at end of file
+            return await recommend_by_track_search(parsed.title or "", k=limit, pool=30, seen=seen)
+
+async def iter_tracks_for_intent(parsed, limit: int = 5, seen=None):
+    """Same picks as get_tracks_for_intent, yielded one by one as soon as each is known."""
+    if not LASTFM_API_KEY:
+        return
+    if parsed.intent == "artist_like":
+        async for t in iter_similar_to_artist(parsed.artist, k=limit, pool_artists=20, seen=seen):
+            yield t
+        return
+    for t in await get_tracks_for_intent(parsed, limit=limit, seen=seen):
+        yield t
@@ -0,0 +1,242 @@
+"""
+Load generator: replays a JSONL prompt log against the agent's /assist endpoint.
+
+Each input line is {"prompt": "...", "user_id"?, "conversation_id"?, "ts"?}
+(or just a JSON string). Requests carry the same envelope as the bot's
+(envelope.assist_request) and the SSE stream is read with sse.SSEDecoder.
+
+Two ways to generate load:
+
+  closed loop  --concurrency N workers, each sends, waits for the whole
+               stream, sleeps an exponential think time (--think mean) and
+               sends the next prompt;
+  open loop    --rate R arrivals/second (Poisson, or --arrival uniform), or
+               --replay to follow the "ts" offsets in the log (--speed 2 =
+               twice as fast). Requests start on schedule whether or not
+               earlier ones finished, and latency is measured from the
+               scheduled start, so a saturated server can't hide its queueing.
+
+Per request it records time to first byte, time to the first FINAL_RESPONSE
+chunk, total stream time, errors and fallback replies; the summary breaks
+these down by intent (parser.parse_prompt on the prompt).
+
+    python loadgen.py prompts.jsonl --concurrency 8 --requests 500
+    python loadgen.py prompts.jsonl --rate 20 --duration 60 --out results.jsonl
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+from envelope import assist_request
+from parser import parse_prompt
+from sse import SSEDecoder
+
+# the agent's built-in fallback picks (music_agent.FALLBACK); seeing exactly these means "no real results"
+FALLBACK_TRACKS = {("The Weeknd", "Blinding Lights"), ("ODESZA", "A Moment Apart"), ("Daft Punk", "Instant Crush")}
+
+
+def load_prompts(path: str) -> list[dict]:
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if isinstance(obj, str):
+                obj = {"prompt": obj}
+            elif "prompt" not in obj:
+                obj["prompt"] = obj.get("content") or obj.get("text") or ""
+            rows.append(obj)
+    return rows
+
+
+async def send(client: httpx.AsyncClient, url: str, row: dict, scheduled: float, timeout: float) -> dict:
+    """One /assist call; times are seconds from `scheduled` (perf_counter)."""
+    rec = {"prompt": row["prompt"], "intent": parse_prompt(row["prompt"]).intent,
+           "ttfb": None, "first_final": None, "total": None, "error": None, "fallback": False}
+    body = assist_request(row["prompt"], user_id=row.get("user_id"), conversation_id=row.get("conversation_id"),
+                          client="loadgen")
+    rec["queued"] = time.perf_counter() - scheduled
+    try:
+        async with asyncio.timeout(timeout):
+            async with client.stream("POST", url, json=body, headers={"Accept": "text/event-stream"}) as resp:
+                if resp.status_code != 200:
+                    await resp.aread()
+                    rec["error"] = f"http_{resp.status_code}"
+                else:
+                    decoder = SSEDecoder()
+                    links = None
+                    async for chunk in resp.aiter_bytes():
+                        if rec["ttfb"] is None:
+                            rec["ttfb"] = time.perf_counter() - scheduled
+                        for ev in decoder.feed(chunk):
+                            if ev.event == "FINAL_RESPONSE" and rec["first_final"] is None:
+                                rec["first_final"] = time.perf_counter() - scheduled
+                            elif ev.event == "ERROR":
+                                rec["error"] = "agent_error"
+                            elif ev.event == "SOURCES":
+                                try:
+                                    links = (json.loads(ev.data).get("content") or {}).get("links")
+                                    links = [(l["artist"], l["title"]) for l in links or ()]
+                                except (ValueError, AttributeError, TypeError, KeyError):
+                                    rec["error"] = "bad_sources"
+                                    links = None
+                    if links:
+                        rec["fallback"] = set(links) <= FALLBACK_TRACKS
+    except TimeoutError:
+        rec["error"] = "timeout"
+    except httpx.HTTPError as e:
+        rec["error"] = type(e).__name__
+    rec["total"] = time.perf_counter() - scheduled
+    return rec
+
+
+async def closed_loop(client, url, rows, n: int, concurrency: int, think: float, timeout: float, records: list):
+    issued = 0
+
+    async def worker():
+        nonlocal issued
+        while issued < n:
+            issued += 1
+            records.append(await send(client, url, next(rows), time.perf_counter(), timeout))
+            if think > 0:
+                await asyncio.sleep(random.expovariate(1 / think))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(client, url, rows, n: int | None, schedule, timeout: float, records: list, max_inflight: int):
+    sem = asyncio.Semaphore(max_inflight) if max_inflight > 0 else None
+    start = time.perf_counter()
+    tasks = []
+
+    async def one(row, scheduled):
+        if sem is None:
+            records.append(await send(client, url, row, scheduled, timeout))
+            return
+        async with sem:
+            records.append(await send(client, url, row, scheduled, timeout))
+
+    for row, offset in itertools.islice(zip(rows, schedule), n):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(row, start + offset)))
+    await asyncio.gather(*tasks)
+
+
+def arrivals(rate: float, kind: str):
+    t = 0.0
+    while True:
+        yield t
+        t += random.expovariate(rate) if kind == "poisson" else 1 / rate
+
+
+def replay_offsets(rows: list[dict], speed: float):
+    stamps = [float(row.get("ts", 0)) for row in rows]
+    first = min(stamps)
+    lap_length = max(stamps) - first + 1  # later laps start a second after the previous one ends
+    for lap in itertools.count():
+        for ts in stamps:
+            yield (lap * lap_length + ts - first) / speed
+
+
+def _pct(values: list[float], q: int) -> float:
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def summarize(records: list[dict], elapsed: float):
+    by_intent = defaultdict(list)
+    for r in records:
+        by_intent[r["intent"]].append(r)
+    print(f"\n{len(records)} requests in {elapsed:.1f}s = {len(records) / elapsed:.1f} req/s")
+    head = f"{'intent':<12}{'n':>6}{'err%':>7}{'fb%':>7}"
+    for metric in ("ttfb", "first_final", "total"):
+        head += f"{metric + ' p50/p95/p99 ms':>28}"
+    print(head)
+    for intent, recs in sorted(by_intent.items()) + [("all", records)]:
+        line = (f"{intent:<12}{len(recs):>6}{100 * sum(bool(r['error']) for r in recs) / len(recs):>7.1f}"
+                f"{100 * sum(r['fallback'] for r in recs) / len(recs):>7.1f}")
+        for metric in ("ttfb", "first_final", "total"):
+            vals = [r[metric] for r in recs if r[metric] is not None and not r["error"]]
+            line += f"{'/'.join(f'{_pct(vals, q) * 1e3:.0f}' for q in (50, 95, 99)):>28}"
+        print(line)
+    errors = defaultdict(int)
+    for r in records:
+        if r["error"]:
+            errors[r["error"]] += 1
+    if errors:
+        print("errors:", ", ".join(f"{k} {v}" for k, v in sorted(errors.items(), key=lambda kv: -kv[1])))
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("prompts", help="JSONL prompt log")
+    ap.add_argument("--url", default="http://127.0.0.1:8000/assist")
+    ap.add_argument("--requests", type=int, default=0, help="stop after this many (default: one pass over the file)")
+    ap.add_argument("--duration", type=float, default=0, help="open loop: stop scheduling after this many seconds")
+    ap.add_argument("--concurrency", type=int, default=4, help="closed loop workers")
+    ap.add_argument("--think", type=float, default=0.0, help="closed loop: mean think time between requests (s)")
+    ap.add_argument("--rate", type=float, default=0, help="open loop arrivals per second")
+    ap.add_argument("--arrival", choices=("poisson", "uniform"), default="poisson")
+    ap.add_argument("--replay", action="store_true", help="open loop following the log's 'ts' offsets")
+    ap.add_argument("--speed", type=float, default=1.0, help="--replay time compression")
+    ap.add_argument("--max-inflight", type=int, default=0, help="open loop client-side cap (0 = none)")
+    ap.add_argument("--timeout", type=float, default=90)
+    ap.add_argument("--shuffle", action="store_true")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--out", help="write one JSON record per request here")
+    args = ap.parse_args()
+
+    random.seed(args.seed)
+    rows = load_prompts(args.prompts)
+    if not rows:
+        raise SystemExit("no prompts in " + args.prompts)
+    if args.shuffle and args.replay:
+        raise SystemExit("--shuffle would scramble the --replay schedule; use one or the other")
+    if args.shuffle:
+        random.shuffle(rows)
+    if args.replay:
+        rows.sort(key=lambda row: float(row.get("ts", 0)))  # offsets must not go backwards
+    n = args.requests or len(rows)
+    open_mode = args.rate > 0 or args.replay
+    if args.duration:
+        if not args.rate:
+            raise SystemExit("--duration needs --rate")
+        n = args.requests or None  # the schedule cut-off ends the run
+    looped = itertools.cycle(rows)
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=max(args.concurrency, 100))
+    records: list[dict] = []
+    async with httpx.AsyncClient(timeout=httpx.Timeout(args.timeout, connect=10), limits=limits) as client:
+        started = time.perf_counter()
+        if open_mode:
+            schedule = replay_offsets(rows, args.speed) if args.replay else arrivals(args.rate, args.arrival)
+            if args.duration:
+                schedule = itertools.takewhile(lambda t: t < args.duration, schedule)
+            await open_loop(client, args.url, looped, n, schedule, args.timeout, records, args.max_inflight)
+        else:
+            await closed_loop(client, args.url, looped, n, args.concurrency, args.think, args.timeout, records)
+        elapsed = time.perf_counter() - started
+
+    summarize(records, elapsed)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,250 @@
+import asyncio
+import bisect
+import json
+import math
+import os
+import threading
+import time
+
+# latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram keyed by label values (Prometheus-style, cumulative on export).
+
+    observe() is a bisect plus a few integer adds, cheap enough to leave on in production.
+    """
+
+    def __init__(self, name: str, help: str = "", buckets=DEFAULT_BUCKETS, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._series: dict[tuple, list] = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        key = tuple(label_values)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def snapshot(self) -> dict[tuple, dict]:
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        out = {}
+        for key, s in series.items():
+            counts, total, n = s[:-2], s[-2], s[-1]
+            out[key] = {"count": n, "sum": total, "buckets": dict(zip(self.buckets + (float("inf"),), counts))}
+        return out
+
+
+class Counter:
+    """Monotonic counter keyed by label values."""
+
+    def __init__(self, name: str, help: str = "", labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        key = tuple(label_values)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def snapshot(self) -> dict[tuple, float]:
+        with self._lock:
+            return dict(self._series)
+
+
+_registry: dict[str, Histogram | Counter] = {}
+_collectors: list = []  # callables returning [(name, help, value), ...] gauges, read at export time
+
+
+def histogram(name: str, help: str = "", buckets=DEFAULT_BUCKETS, labels: tuple[str, ...] = ()) -> Histogram:
+    """Get or create a histogram by name."""
+    h = _registry.get(name)
+    if h is None:
+        h = _registry[name] = Histogram(name, help, buckets, labels)
+    return h
+
+
+def counter(name: str, help: str = "", labels: tuple[str, ...] = ()) -> Counter:
+    """Get or create a counter by name."""
+    c = _registry.get(name)
+    if c is None:
+        c = _registry[name] = Counter(name, help, labels)
+    return c
+
+
+def register_collector(fn):
+    """
+    Add a source of values kept elsewhere; fn() is only called when metrics are exported, so it
+    costs nothing per request. It returns (name, help, value) gauges, or (name, help, value, "counter")
+    for running totals.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+# --- export --------------------------------------------------------------------
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_prometheus() -> str:
+    """Everything registered, in the Prometheus text exposition format (0.0.4)."""
+    out = []
+    for m in list(_registry.values()):
+        if m.help:
+            out.append(f"# HELP {m.name} {m.help}")
+        if isinstance(m, Counter):
+            out.append(f"# TYPE {m.name} counter")
+            for key, v in sorted(m.snapshot().items()):
+                out.append(f"{m.name}{_labels(m.labels, key)} {_fmt(v)}")
+            continue
+        out.append(f"# TYPE {m.name} histogram")
+        for key, s in sorted(m.snapshot().items()):
+            running = 0
+            for le, n in s["buckets"].items():
+                running += n
+                le_label = 'le="' + _fmt(le) + '"'
+                out.append(f"{m.name}_bucket{_labels(m.labels, key, le_label)} {running}")
+            out.append(f"{m.name}_sum{_labels(m.labels, key)} {_fmt(s['sum'])}")
+            out.append(f"{m.name}_count{_labels(m.labels, key)} {s['count']}")
+    for fn in _collectors:
+        for name, help, value, *kind in fn():
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind[0] if kind else 'gauge'}")
+            out.append(f"{name} {_fmt(value)}")
+    return "\n".join(out) + "\n"
+
+
+def snapshot() -> dict:
+    """JSON-friendly view of every metric (label values joined with ',')."""
+    out = {}
+    for m in list(_registry.values()):
+        series = m.snapshot()
+        if isinstance(m, Histogram):
+            series = {k: {**v, "buckets": {_fmt(le): n for le, n in v["buckets"].items()}} for k, v in series.items()}
+        out[m.name] = {",".join(k): v for k, v in series.items()}
+    for fn in _collectors:
+        for name, _, value, *_ in fn():
+            out[name] = value
+    return out
+
+
+def dump_jsonl(path: str):
+    """Append one {"ts": ..., "pid": ..., "metrics": {...}} line to path (one line per worker process)."""
+    line = json.dumps({"ts": time.time(), "pid": os.getpid(), "metrics": snapshot()}, separators=(",", ":"))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+async def dump_periodically(path: str, interval: float = 60.0):
+    """Background task: dump_jsonl(path) every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(dump_jsonl, path)
+        except OSError as e:
+            print("metrics dump failed:", e)
+
+
+# --- the agent's metrics ------------------------------------------------------
+
+# parse_prompt is microseconds, not milliseconds
+FAST_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2)
+
+PARSE_SECONDS = histogram(
+    "musicagent_parse_seconds",
+    "Time spent in parse_prompt().",
+    buckets=FAST_BUCKETS,
+)
+TIME_TO_FIRST_TRACK = histogram(
+    "musicagent_time_to_first_track_seconds",
+    "Time from the start of assist() until the first suggestion is streamed.",
+    labels=("intent",),
+)
+ASSIST_SECONDS = histogram(
+    "musicagent_assist_seconds",
+    "Total assist() duration.",
+    labels=("intent",),
+)
+LASTFM_SECONDS = histogram(
+    "musicagent_lastfm_request_seconds",
+    "Latency of single Last.fm HTTP requests (each retry counts separately).",
+    labels=("method",),
+)
+LASTFM_ERRORS = counter(
+    "musicagent_lastfm_errors_total",
+    "Failed Last.fm requests by method and kind (transport, http_<status>, api_<code>).",
+    labels=("method", "kind"),
+)
+LASTFM_LIMITER_WAIT = histogram(
+    "musicagent_lastfm_limiter_wait_seconds",
+    "Time Last.fm calls waited for a rate-limiter token (0 when one was free).",
+)
+LASTFM_GAVE_UP = counter(
+    "musicagent_lastfm_gave_up_total",
+    "Last.fm fetches that failed after using up their retries or deadline.",
+    labels=("method",),
+)
+LASTFM_RETRIES_TOTAL = counter(
+    "musicagent_lastfm_retries_total",
+    "Last.fm requests retried after a transient failure.",
+    labels=("method",),
+)
+LASTFM_HEDGES = counter(
+    "musicagent_lastfm_hedges_total",
+    "Hedged (duplicate) Last.fm requests sent after the hedge delay, and how many of them won.",
+    labels=("method", "outcome"),
+)
+BUDGET_TIMEOUTS = counter(
+    "musicagent_budget_timeouts_total",
+    "Last.fm waits cut short by the request's latency budget, by what was served instead (expired_cache, none).",
+    labels=("method", "served"),
+)
+CACHE_LOOKUPS = counter(
+    "musicagent_cache_lookups_total",
+    "Last.fm response cache lookups by outcome (hit, stale, miss, coalesced).",
+    labels=("outcome",),
+)
+FALLBACKS = counter(
+    "musicagent_fallbacks_total",
+    "Replies that used the built-in fallback list, by reason (no_results, budget, error).",
+    labels=("reason",),
+)
+ASSIST_ERRORS = counter(
+    "musicagent_assist_errors_total",
+    "Unexpected exceptions in assist(), by exception type.",
+    labels=("type",),
+)
+PREFETCH_REFRESHES = counter(
+    "musicagent_prefetch_total",
+    "Prefetcher pool refreshes by outcome (ok, error, throttled, paused).",
+    labels=("outcome",),
+)
@@ -1,36 +1,111 @@
 from sentient_agent_framework import AbstractAgent, DefaultServer, Session, Query, ResponseHandler
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 from dotenv import load_dotenv
-import os, traceback
+import os, json, time, asyncio, traceback
 
 from parser import parse_prompt                
-from lastfm import get_tracks_for_intent    
+import budget
+import lastfm
+from lastfm import iter_tracks_for_intent
+from track import Track
+import metrics
+from metrics import (
+    ASSIST_ERRORS, ASSIST_SECONDS, FALLBACKS, PARSE_SECONDS, TIME_TO_FIRST_TRACK,
+)
+from profiling import profile_if_slow
+from prefetch import PREFETCH, prefetcher
+from history import ConversationHistory, SharedConversationHistory
+from playlist import CallPlan, iter_playlist
+from envelope import conversation_ulid
 
 load_dotenv()
 
+METRICS_JSONL = os.getenv("METRICS_JSONL", "").strip()  # optional: append a metrics snapshot here periodically
+METRICS_JSONL_INTERVAL = float(os.getenv("METRICS_JSONL_INTERVAL", "60"))
+# latency budget for finding tracks; Last.fm waits past it fall back to older cached or partial results
+ASSIST_BUDGET = float(os.getenv("ASSIST_BUDGET", "8"))  # seconds, 0 = no budget
+
+# serving; AGENT_WORKERS > 1 runs that many processes on one socket, sharing state through SHARED_STATE_PATH
+AGENT_HOST = os.getenv("AGENT_HOST", "0.0.0.0")
+AGENT_PORT = int(os.getenv("AGENT_PORT", "8000"))
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+AGENT_GRACEFUL_TIMEOUT = float(os.getenv("AGENT_GRACEFUL_TIMEOUT", "30"))  # open streams get this long on restart
+
 FALLBACK = [
-    {"artist": "The Weeknd", "title": "Blinding Lights",
-     "youtube": "https://www.youtube.com/results?search_query=The+Weeknd+Blinding+Lights"},
-    {"artist": "ODESZA", "title": "A Moment Apart",
-     "youtube": "https://www.youtube.com/results?search_query=ODESZA+A+Moment+Apart"},
-    {"artist": "Daft Punk", "title": "Instant Crush",
-     "youtube": "https://www.youtube.com/results?search_query=Daft+Punk+Instant+Crush"},
+    Track("The Weeknd", "Blinding Lights"),
+    Track("ODESZA", "A Moment Apart"),
+    Track("Daft Punk", "Instant Crush"),
 ]
-_last_seen: dict[str, set[tuple[str, str]]] = {}
+# recently served tracks per conversation, so repeat prompts in a channel get new picks
+_history_limits = dict(
+    per_conversation=int(os.getenv("HISTORY_PER_CONVERSATION", "100")),
+    max_conversations=int(os.getenv("HISTORY_MAX_CONVERSATIONS", "10000")),
+    idle_ttl=float(os.getenv("HISTORY_IDLE_TTL", str(6 * 3600))),
+)
+# with several workers a channel can land on any of them, so the history has to be shared
+_last_seen = (SharedConversationHistory(lastfm.SHARED_STATE_PATH, **_history_limits) if lastfm.SHARED_STATE_PATH
+              else ConversationHistory(**_history_limits))
+
+
+def history_key(conversation_id: str | None) -> str | None:
+    """History key for a raw conversation (Discord channel) id: the activity_id the bot sends for it."""
+    return conversation_ulid(str(conversation_id)) if conversation_id else None
+
+
+def _conversation_id(session: Session) -> str | None:
+    # over HTTP the session only keeps activity_id, which the bot sets to conversation_ulid(channel id);
+    # embedded sessions also carry the raw conversation_id, so map that the same way
+    raw = getattr(session, "conversation_id", None)
+    if raw:
+        return history_key(raw)
+    conv = getattr(session, "activity_id", None)
+    return str(conv) if conv else None
 
 class MusicAgent(AbstractAgent):
     def __init__(self):
         super().__init__("MusicAgent")
+        self._metrics_dump: asyncio.Task | None = None
+
+    async def startup(self):
+        # open the pooled Last.fm client once for the whole process
+        await lastfm.startup()
+        if PREFETCH:
+            prefetcher.start()  # keeps mood + popular vibe pools warm
+        if METRICS_JSONL and self._metrics_dump is None:
+            self._metrics_dump = asyncio.create_task(metrics.dump_periodically(METRICS_JSONL, METRICS_JSONL_INTERVAL))
+
+    async def shutdown(self):
+        await prefetcher.stop()
+        if self._metrics_dump is not None:
+            self._metrics_dump.cancel()
+            self._metrics_dump = None
+            metrics.dump_jsonl(METRICS_JSONL)
+        if isinstance(_last_seen, SharedConversationHistory):
+            _last_seen.close()
+        await lastfm.shutdown()
 
     async def assist(self, session: Session, query: Query, response_handler: ResponseHandler):
+        # PROFILE_SLOW_MS > 0 samples a fraction of requests and keeps the profile of slow ones
+        with profile_if_slow("assist"):
+            await self._assist(session, query, response_handler)
+
+    async def _assist(self, session: Session, query: Query, response_handler: ResponseHandler):
         async def safe_complete():
             try:
                 await response_handler.complete()
             except Exception:
                 pass
 
+        started = time.perf_counter()
+        intent = "unknown"
         try:
             raw = (query.prompt or "").strip() or "workout"
             parsed = parse_prompt(raw)
+            intent = parsed.intent
+            PARSE_SECONDS.observe(time.perf_counter() - started)
+            if intent == "vibe":
+                prefetcher.note(parsed.vibe)
 
             # Greeting → friendly reply and stop (no API calls)
             if parsed.intent == "greeting":
@@ -71,35 +146,121 @@ class MusicAgent(AbstractAgent):
             if not os.getenv("LASTFM_API_KEY"):
                 await response_handler.emit_text_block("WARNING", "LASTFM_API_KEY not found; using fallback.")
 
-            # Fetch suggestions (handles mood→vibe, fuzzy artists)
-            suggestions = await get_tracks_for_intent(parsed, limit=5)
+            # Stream each pick as soon as it is resolved (handles mood→vibe, fuzzy artists);
+            # SOURCES goes out once the list is complete
+            conv_id = _conversation_id(session)
+            suggestions = []
+            stream = None
+            seen = await _last_seen.aseen(conv_id)
+            with budget.scope(ASSIST_BUDGET):  # every Last.fm wait below (fan-out tasks included) stays inside it
+                async for s in iter_tracks_for_intent(parsed, limit=5, seen=seen):
+                    if stream is None:
+                        TIME_TO_FIRST_TRACK.observe(time.perf_counter() - started, parsed.intent)
+                        stream = response_handler.create_text_stream("FINAL_RESPONSE")
+                        await stream.emit_chunk("Here are some picks:\n")
+                    suggestions.append(s)
+                    await stream.emit_chunk(f"- {s.artist} — {s.title}\n")
+                out_of_time = budget.expired()
+
+            await _last_seen.arecord(conv_id, suggestions)
             if not suggestions:
+                FALLBACKS.inc("budget" if out_of_time else "no_results")
                 suggestions = FALLBACK
-
-            # Emit sources + streamed list
-            await response_handler.emit_json("SOURCES", {"links": suggestions})
-
-            stream = response_handler.create_text_stream("FINAL_RESPONSE")
-            await stream.emit_chunk("Here are some picks:\n")
-            for s in suggestions:
-                await stream.emit_chunk(f"- {s['artist']} — {s['title']}\n")
+                TIME_TO_FIRST_TRACK.observe(time.perf_counter() - started, parsed.intent)
+                stream = response_handler.create_text_stream("FINAL_RESPONSE")
+                await stream.emit_chunk("Here are some picks:\n")
+                for s in suggestions:
+                    await stream.emit_chunk(f"- {s.artist} — {s.title}\n")
             await stream.complete()
+
+            await response_handler.emit_json("SOURCES", {"links": [s.to_dict() for s in suggestions]})
             await safe_complete()
 
         except Exception as e:
+            ASSIST_ERRORS.inc(type(e).__name__)
+            FALLBACKS.inc("error")
             # Never leak a traceback into SSE
             await response_handler.emit_text_block("ERROR", "Unexpected error. Showing safe defaults.")
             print("MusicAgent error:", e)
             import traceback; traceback.print_exc()
 
-            await response_handler.emit_json("SOURCES", {"links": FALLBACK})
+            await response_handler.emit_json("SOURCES", {"links": [s.to_dict() for s in FALLBACK]})
             stream = response_handler.create_text_stream("FINAL_RESPONSE")
             await stream.emit_chunk("Here are some picks:\n")
             for s in FALLBACK:
-                await stream.emit_chunk(f"- {s['artist']} — {s['title']}\n")
+                await stream.emit_chunk(f"- {s.artist} — {s.title}\n")
             await stream.complete()
             await safe_complete()
+        finally:
+            ASSIST_SECONDS.observe(time.perf_counter() - started, intent)
+
+class PlaylistRequest(BaseModel):
+    prompts: list[str]
+    size: int = 50
+    conversation_id: str | None = None
+
+
+class MusicServer(DefaultServer):
+    """DefaultServer that also ties the agent's startup/shutdown to the app lifecycle."""
+
+    def __init__(self, agent: MusicAgent):
+        super().__init__(agent)
+        self._app.add_event_handler("startup", agent.startup)
+        self._app.add_event_handler("shutdown", agent.shutdown)
+        self._app.get("/metrics")(self.metrics_endpoint)
+        self._app.post("/playlist")(self.playlist_endpoint)
+
+    async def metrics_endpoint(self):
+        """Prometheus text exposition of everything in metrics.py."""
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    async def playlist_endpoint(self, request: PlaylistRequest):
+        """Many seed prompts -> one playlist, streamed as NDJSON (one track per line, then a summary)."""
+        async def lines():
+            plan = CallPlan()
+            tracks = []
+            conv_id = history_key(request.conversation_id)  # same key /assist uses for this channel
+            seen = await _last_seen.aseen(conv_id)
+            async for t in iter_playlist(request.prompts, request.size, seen, plan):
+                tracks.append(t)
+                yield json.dumps(t, ensure_ascii=False) + "\n"
+            await _last_seen.arecord(conv_id, tracks)
+            yield json.dumps({"done": True, "count": len(tracks), "lookups": plan.stats()}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def create_app():
+    """App factory for uvicorn's worker processes (each builds its own agent)."""
+    return MusicServer(MusicAgent())._app
+
+
+def run_workers(n: int):
+    """
+    Serve with n worker processes on one listening socket (uvicorn's supervisor).
+
+    Workers share the Last.fm rate-limit budget, the pool store and
+    conversation history through one SQLite file; unless SHARED_STATE_PATH /
+    LASTFM_STORE_PATH are set it goes in the temp dir. kill -HUP <supervisor>
+    restarts the workers one at a time, each finishing its open streams
+    first (up to AGENT_GRACEFUL_TIMEOUT), so the others keep serving; a
+    worker that dies is replaced.
+    """
+    import tempfile
+    import uvicorn
+
+    state = os.environ.get("SHARED_STATE_PATH") or os.path.join(tempfile.gettempdir(), f"musicagent-{AGENT_PORT}.db")
+    os.environ["SHARED_STATE_PATH"] = state  # read by the workers when they import lastfm
+    if not os.environ.get("LASTFM_STORE_PATH"):
+        os.environ["LASTFM_STORE_PATH"] = state
+    print(f"Starting {n} workers on {AGENT_HOST}:{AGENT_PORT}, shared state in {state}")
+    uvicorn.run("music_agent:create_app", factory=True, host=AGENT_HOST, port=AGENT_PORT, workers=n,
+                timeout_graceful_shutdown=AGENT_GRACEFUL_TIMEOUT)
+
 
 if __name__ == "__main__":
-    server = DefaultServer(MusicAgent())
-    server.run()
+    if AGENT_WORKERS > 1:
+        run_workers(AGENT_WORKERS)
+    else:
+        server = MusicServer(MusicAgent())
+        server.run(AGENT_HOST, AGENT_PORT)
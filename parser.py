@@ -1,7 +1,8 @@
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 
-@dataclass
+@dataclass(frozen=True)  # memoized instances are shared between callers
 class ParsedPrompt:
     intent: str          # "greeting" | "mood" | "vibe" | "track" | "artist_like" | "artist_top"
     vibe: str | None = None
@@ -22,19 +23,103 @@ MOOD_MAP = {
     "energetic": ["energetic", "hype", "workout", "pump"],
 }
 
+MEMO_SIZE = 4096  # distinct prompts kept by parse_prompt's LRU memo
+
+LIKE_RE = re.compile(r"(?:like|similar to)\s+(.+)$", re.IGNORECASE)
+TOP_RE = re.compile(r"^(?:top\s+(?:songs|tracks)\s+by|by)\s+(.+)$", re.IGNORECASE)
+TOP_RE_LOOSE = re.compile(r"^top\s+(?:song|songs|track|tracks)\s+by\s+(.+)$", re.IGNORECASE)
+
+GREETINGS = {"hi", "hello", "hey", "yo", "sup"}
+GREETING_PREFIXES = ("hi ", "hello ", "hey ")
+
+
+def _trie_pattern(node: dict) -> str:
+    # children are keyed by one char, None marks the end of a keyword; the optional
+    # group is greedy so the longest keyword starting at a position wins
+    alts = [re.escape(ch) + _trie_pattern(child) for ch, child in node.items() if ch is not None]
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    return f"(?:{body})?" if None in node else body
+
+
+def _build_mood_matcher(mood_map: dict):
+    """
+    One regex over every mood keyword, shaped as a trie so the cost per text
+    position depends on keyword length, not on how many keywords there are.
+
+    The zero-width lookahead reports the longest keyword starting at each
+    position; _kw_rank maps it to the best (lowest) MOOD_MAP rank among it
+    and every keyword that is a prefix of it, which gives the same answer as
+    checking `k in text` for each keyword in MOOD_MAP order.
+    """
+    moods = list(mood_map)
+    root: dict = {}
+    rank: dict[str, int] = {}
+    for i, keywords in enumerate(mood_map.values()):
+        for k in keywords:
+            rank.setdefault(k, i)
+            node = root
+            for ch in k:
+                node = node.setdefault(ch, {})
+            node[None] = True
+
+    kw_rank: dict[str, int] = {}
+
+    def walk(node: dict, prefix: str, best: int):
+        if None in node:
+            best = min(best, rank[prefix])
+            kw_rank[prefix] = best
+        for ch, child in node.items():
+            if ch is not None:
+                walk(child, prefix + ch, best)
+
+    walk(root, "", len(moods))
+    regex = re.compile(f"(?=({_trie_pattern(root)}))") if rank else None
+
+    # "i am <mood>" only matters for moods whose own keywords don't already cover the mood name
+    prefix_moods = [
+        (i, (f"i am {m}", f"i'm {m}"))
+        for i, (m, keywords) in enumerate(mood_map.items())
+        if not any(k in f"i am {m}" and k in f"i'm {m}" for k in keywords)
+    ]
+    return moods, regex, kw_rank, prefix_moods
+
+
+_moods, _mood_re, _kw_rank, _prefix_moods = _build_mood_matcher(MOOD_MAP)
+
+
+def refresh_moods():
+    """Rebuild the matcher after MOOD_MAP changes (and drop memoized parses)."""
+    global _moods, _mood_re, _kw_rank, _prefix_moods
+    _moods, _mood_re, _kw_rank, _prefix_moods = _build_mood_matcher(MOOD_MAP)
+    _parse.cache_clear()
+
+
 def _detect_greeting(t: str) -> bool:
-    return t.lower() in {"hi", "hello", "hey", "yo", "sup"} or t.lower().startswith(("hi ", "hello ", "hey "))
+    low = t.lower()
+    return low in GREETINGS or low.startswith(GREETING_PREFIXES)
 
 def _detect_mood(t: str) -> str | None:
     low = t.lower()
-    for mood, keywords in MOOD_MAP.items():
-        if any(k in low for k in keywords) or low.startswith(f"i am {mood}") or low.startswith(f"i'm {mood}"):
-            return mood
-    return None
+    best = len(_moods)
+    if _mood_re is not None:
+        for m in _mood_re.finditer(low):
+            r = _kw_rank[m.group(1)]
+            if r < best:
+                best = r
+                if r == 0:
+                    break
+    for i, prefixes in _prefix_moods:
+        if i < best and low.startswith(prefixes):
+            best = i
+    return _moods[best] if best < len(_moods) else None
 
 def parse_prompt(text: str) -> ParsedPrompt:
-    t = (text or "").strip()
+    return _parse((text or "").strip())
 
+@lru_cache(maxsize=MEMO_SIZE)
+def _parse(t: str) -> ParsedPrompt:
     if not t:
         return ParsedPrompt(intent="greeting", raw=t)
     
@@ -53,15 +138,13 @@ def parse_prompt(text: str) -> ParsedPrompt:
             return ParsedPrompt(intent="track", artist=parts[0].strip(), title=parts[1].strip(), raw=t)
 
     # Pattern 2: "like <artist>" / "similar to <artist>"
-    m = re.search(r"(?:like|similar to)\s+(.+)$", t, re.IGNORECASE)
+    m = LIKE_RE.search(t)
     if m:
         return ParsedPrompt(intent="artist_like", artist=m.group(1).strip(), raw=t)
 
     # Pattern 3: "<artist> top tracks" / "top songs by <artist>"
-    m2 = re.search(r"^(?:top\s+(?:songs|tracks)\s+by|by)\s+(.+)$", t, re.IGNORECASE)
-    if not m2:
-        # also catch "top track by katty pery" exactly if user write it by mistake
-        m2 = re.search(r"^top\s+(?:song|songs|track|tracks)\s+by\s+(.+)$", t, re.IGNORECASE)
+    # (TOP_RE_LOOSE also catches "top track by katty pery" exactly if user write it by mistake)
+    m2 = TOP_RE.search(t) or TOP_RE_LOOSE.search(t)
     if m2:
         return ParsedPrompt(intent="artist_top", artist=m2.group(1).strip(), raw=t)
 
@@ -0,0 +1,209 @@
+import asyncio
+import math
+import os
+import random
+
+import lastfm
+from history import track_hash
+from parser import parse_prompt
+from track import youtube_link
+
+# Batch playlists: many seed prompts -> one deduplicated, interleaved track list.
+PLAYLIST_MAX_TRACKS = int(os.getenv("PLAYLIST_MAX_TRACKS", "200"))
+PLAYLIST_MAX_SEEDS = int(os.getenv("PLAYLIST_MAX_SEEDS", "20"))
+PLAYLIST_CONCURRENCY = int(os.getenv("PLAYLIST_CONCURRENCY", "8"))  # Last.fm lookups in flight, all playlists
+PLAYLIST_LEAD = 2  # how far one seed may get ahead of a seed that is still loading
+
+_sem: asyncio.Semaphore | None = None
+
+
+def _norm(s: str) -> str:
+    return " ".join(s.lower().split())
+
+
+def _global_sem() -> asyncio.Semaphore:
+    global _sem
+    if _sem is None:
+        _sem = asyncio.Semaphore(max(1, PLAYLIST_CONCURRENCY))
+    return _sem
+
+
+class CallPlan:
+    """
+    The Last.fm lookups one playlist needs, each run at most once.
+
+    Seeds ask for lookups by key (("similar", "drake", 20), ("top", "sza", 3), ...);
+    the first ask starts it under the global semaphore and every later ask
+    for the same key shares the task. Failed lookups resolve to an empty
+    result instead of raising.
+    """
+
+    def __init__(self):
+        self._tasks: dict[tuple, asyncio.Task] = {}
+        self.requested = 0
+
+    def get(self, key: tuple, factory) -> asyncio.Task:
+        self.requested += 1
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.create_task(self._run(factory))
+        return task
+
+    @staticmethod
+    async def _run(factory):
+        async with _global_sem():
+            try:
+                return await factory()
+            except Exception:
+                return None
+
+    def stats(self) -> dict:
+        return {"requested": self.requested, "unique": len(self._tasks)}
+
+    async def close(self):
+        for t in self._tasks.values():
+            t.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    # --- the lookups, keyed so identical ones across seeds collapse (each returns a task) ---
+
+    def resolve(self, name: str) -> asyncio.Task:
+        return self.get(("resolve", _norm(name)), lambda: lastfm.resolve_artist(name))
+
+    def tag(self, tag: str, pool: int) -> asyncio.Task:
+        return self.get(("tag", _norm(tag), pool), lambda: lastfm.tag_pool(tag, pool))
+
+    def search(self, query: str, limit: int) -> asyncio.Task:
+        return self.get(("search", _norm(query), limit), lambda: lastfm.track_search_pool(query, limit))
+
+    def similar(self, artist: str, limit: int) -> asyncio.Task:
+        return self.get(("similar", _norm(artist), limit), lambda: lastfm.similar_artists(artist, limit))
+
+    def top(self, artist: str, pool: int) -> asyncio.Task:
+        return self.get(("top", _norm(artist), pool), lambda: lastfm.artist_top_pool(artist, pool))
+
+
+class _Seed:
+    __slots__ = ("prompt", "candidates", "pos", "emitted", "done")
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.candidates: list[tuple[str, str]] = []
+        self.pos = 0
+        self.emitted = 0
+        self.done = False
+
+
+async def _fill(seed: _Seed, parsed, quota: int, plan: CallPlan, changed: asyncio.Event, seen):
+    """Collect (artist, title) candidates for one seed, appending as lookups finish."""
+
+    def add(pairs):
+        pairs = list(pairs or ())
+        random.shuffle(pairs)
+        if seen:  # tracks this conversation already heard go last
+            pairs.sort(key=lambda p: track_hash(p[0], p[1]) in seen)
+        seed.candidates.extend(pairs)
+        changed.set()
+
+    try:
+        match parsed.intent:
+            case "vibe" | "mood":
+                add(await plan.tag(parsed.vibe, max(40, 2 * quota)))
+            case "artist_top":
+                artist = await plan.resolve(parsed.artist) or parsed.artist
+                add((artist, t) for t in await plan.top(artist, max(25, 2 * quota)) or ())
+            case "artist_like":
+                artist = await plan.resolve(parsed.artist) or parsed.artist
+                # one top track per similar artist, in completion order; the small pool is
+                # the one /assist uses, so both share cache entries
+                lookups = {plan.top(n, 3): n for n in await plan.similar(artist, max(20, quota)) or ()}
+                pending, spare = set(lookups), []
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for t in done:
+                        titles = list(t.result() or ())
+                        random.shuffle(titles)
+                        if titles:
+                            add([(lookups[t], titles[0])])
+                            spare += ((lookups[t], title) for title in titles[1:])
+                # other top tracks go last, for when seeds share similar artists
+                add(spare)
+            case _:
+                q = f"{parsed.artist} {parsed.title}".strip() if parsed.artist and parsed.title else (parsed.title or parsed.raw)
+                add(await plan.search(q, max(30, 2 * quota)))
+    finally:
+        seed.done = True
+        changed.set()
+
+
+async def iter_playlist(prompts: list[str], size: int = 50, seen=None, plan: CallPlan | None = None):
+    """
+    Yield playlist tracks ({artist, title, youtube, seed}) as soon as they can be placed.
+
+    Seeds take turns (round robin over the prompts that have candidates ready),
+    each capped at its share of `size` until every seed is done, after which
+    leftovers fill the remaining slots. A track appears at most once. Pass a
+    CallPlan to read its lookup stats afterwards.
+    """
+    size = max(1, min(size, PLAYLIST_MAX_TRACKS))
+    seeds, parsed_seeds, keys = [], [], set()
+    for p in prompts[:PLAYLIST_MAX_SEEDS]:
+        parsed = parse_prompt(p)
+        key = (parsed.intent, _norm(parsed.vibe or ""), _norm(parsed.artist or ""), _norm(parsed.title or ""))
+        if parsed.intent == "greeting" or key in keys:
+            continue
+        keys.add(key)
+        seeds.append(_Seed(p))
+        parsed_seeds.append(parsed)
+    if not seeds or not lastfm.LASTFM_API_KEY:
+        return
+
+    quota = math.ceil(size / len(seeds))
+    plan = plan or CallPlan()
+    changed = asyncio.Event()
+    fillers = [asyncio.create_task(_fill(s, p, quota, plan, changed, seen)) for s, p in zip(seeds, parsed_seeds)]
+    taken: set[int] = set()
+    count = 0
+    try:
+        while count < size:
+            changed.clear()
+            live = [s for s in seeds if s.emitted < quota and (not s.done or s.pos < len(s.candidates))]
+            if not live:
+                if not all(s.done for s in seeds):
+                    await changed.wait()
+                    continue
+                if quota >= size:
+                    break  # nothing left anywhere
+                quota = size  # every seed is done: let the ones with leftovers fill the gap
+                continue
+            # a seed with candidates ready may run at most PLAYLIST_LEAD tracks ahead of one
+            # still loading, so the stream starts at once but stays interleaved
+            floor = min(s.emitted for s in live)
+            progressed = False
+            for seed in live:
+                if count >= size or seed.emitted >= floor + PLAYLIST_LEAD:
+                    continue
+                while seed.pos < len(seed.candidates):
+                    artist, title = seed.candidates[seed.pos]
+                    seed.pos += 1
+                    progressed = True
+                    h = track_hash(artist, title)
+                    if h in taken:
+                        continue
+                    taken.add(h)
+                    seed.emitted += 1
+                    count += 1
+                    yield {"artist": artist or "Unknown", "title": title or "Unknown",
+                           "youtube": youtube_link(artist, title), "seed": seed.prompt}
+                    break
+            if not progressed:
+                await changed.wait()
+    finally:
+        for t in fillers:
+            t.cancel()
+        await asyncio.gather(*fillers, return_exceptions=True)
+        await plan.close()
+
+
+async def build_playlist(prompts: list[str], size: int = 50, seen=None) -> list[dict]:
+    return [t async for t in iter_playlist(prompts, size, seen)]
@@ -0,0 +1,181 @@
+import asyncio
+import fcntl
+import heapq
+import math
+import os
+import random
+import time
+
+import lastfm
+from metrics import PREFETCH_REFRESHES, register_collector
+from parser import MOOD_MAP
+
+# Background refresh of tag pools for every mood plus the most requested vibes,
+# so those prompts are answered from memory. PREFETCH=0 turns it off.
+PREFETCH = os.getenv("PREFETCH", "1") != "0"
+PREFETCH_TOP_VIBES = int(os.getenv("PREFETCH_TOP_VIBES", "20"))
+PREFETCH_TICK = float(os.getenv("PREFETCH_TICK", "30"))          # seconds between passes (±20% jitter)
+PREFETCH_MARGIN = float(os.getenv("PREFETCH_MARGIN", "300"))     # refresh pools this long before they go stale
+PREFETCH_HEADROOM = float(os.getenv("PREFETCH_HEADROOM", "3"))   # limiter tokens always left for live requests
+PREFETCH_HALF_LIFE = float(os.getenv("PREFETCH_HALF_LIFE", "3600"))  # how fast vibe popularity fades (s)
+PREFETCH_BACKOFF_MAX = float(os.getenv("PREFETCH_BACKOFF_MAX", "900"))
+TAG_POOL = 40  # same pool size recommend_by_tag asks for, so the cache key matches
+
+
+def _norm(vibe: str) -> str:
+    return " ".join(vibe.lower().split())
+
+
+class VibeCounter:
+    """
+    Request counts per vibe with exponential decay, so the top N follows current traffic.
+
+    Instead of decaying every score, each new hit is weighted 2**(t / half_life);
+    scores are rescaled once the weights grow large. Only `max_tracked` vibes
+    are kept (the weakest half is dropped when full).
+    """
+
+    def __init__(self, half_life: float = 3600.0, max_tracked: int = 2000):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._scores: dict[str, float] = {}
+        self._epoch = time.monotonic()
+
+    def add(self, vibe: str):
+        vibe = _norm(vibe)
+        if not vibe:
+            return
+        exp = (time.monotonic() - self._epoch) / self.half_life
+        if exp > 500:  # keep the weights well inside float range
+            scale = 2.0 ** -exp
+            self._scores = {k: v * scale for k, v in self._scores.items()}
+            self._epoch = time.monotonic()
+            exp = 0.0
+        self._scores[vibe] = self._scores.get(vibe, 0.0) + 2.0 ** exp
+        if len(self._scores) > self.max_tracked:
+            keep = heapq.nlargest(self.max_tracked // 2, self._scores.items(), key=lambda kv: kv[1])
+            self._scores = dict(keep)
+
+    def top(self, n: int) -> list[str]:
+        return [k for k, _ in heapq.nlargest(n, self._scores.items(), key=lambda kv: kv[1])]
+
+
+class Prefetcher:
+    """
+    Keeps tag.getTopTracks pools warm for every MOOD_MAP mood and the top-N vibes.
+
+    Every tick (jittered) it refreshes the pools that are missing or within
+    `margin` of going stale, most urgent first. It only spends a limiter token
+    when at least `headroom` are available, so live requests never queue
+    behind it, and it backs off exponentially on its own failures and while
+    live fetches are failing.
+
+    With several workers sharing state (lastfm.SHARED_STATE_PATH), only the
+    worker holding an flock on a file next to it prefetches, and it writes
+    the pools to the shared store; if that worker dies the lock is freed and
+    another one takes over on its next pass.
+    """
+
+    def __init__(self, top_vibes: int = PREFETCH_TOP_VIBES, tick: float = PREFETCH_TICK,
+                 margin: float = PREFETCH_MARGIN, headroom: float = PREFETCH_HEADROOM):
+        self.top_vibes = top_vibes
+        self.tick = tick
+        self.margin = margin
+        self.headroom = headroom
+        self.vibes = VibeCounter(PREFETCH_HALF_LIFE)
+        self._failures = 0
+        self._task: asyncio.Task | None = None
+        self._lock_file = None
+
+    def note(self, vibe: str | None):
+        """Record a requested vibe (called from assist)."""
+        if vibe:
+            self.vibes.add(vibe)
+
+    def targets(self) -> list[str]:
+        moods = [_norm(m) for m in MOOD_MAP]
+        vibes = [v for v in self.vibes.top(self.top_vibes + len(moods)) if v not in moods]
+        return moods + vibes[:self.top_vibes]
+
+    def _leader(self) -> bool:
+        if not lastfm.SHARED_STATE_PATH or self._lock_file is not None:
+            return True
+        f = open(lastfm.SHARED_STATE_PATH + ".prefetch.lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _due(self) -> list[tuple[float, str]]:
+        due = []
+        for tag in self.targets():
+            left = lastfm.fresh_for(lastfm.tag_pool_params(tag, TAG_POOL))
+            # randomize the margin a little so pools fetched together don't stay in lockstep
+            if left is None or left < self.margin * random.uniform(0.8, 1.0):
+                due.append((-math.inf if left is None else left, tag))
+        due.sort()
+        return due
+
+    async def run_once(self) -> int:
+        """One pass; returns how many pools were refreshed."""
+        if not lastfm.LASTFM_API_KEY or not self._leader():
+            return 0
+        if lastfm.upstream_failing(self.tick):
+            PREFETCH_REFRESHES.inc("paused")
+            return 0
+        done = 0
+        for _, tag in self._due():
+            if lastfm._limiter.rate > 0 and lastfm._limiter.available() < self.headroom:
+                PREFETCH_REFRESHES.inc("throttled")
+                break
+            try:
+                await lastfm.refresh(lastfm.tag_pool_params(tag, TAG_POOL), lastfm._norm_tag_pool)
+            except Exception as e:
+                self._failures += 1
+                PREFETCH_REFRESHES.inc("error")
+                print(f"prefetch of '{tag}' failed ({e}); backing off")
+                break
+            self._failures = 0
+            PREFETCH_REFRESHES.inc("ok")
+            done += 1
+        return done
+
+    def _delay(self) -> float:
+        base = self.tick * 2 ** self._failures if self._failures else self.tick
+        return min(base, max(self.tick, PREFETCH_BACKOFF_MAX)) * random.uniform(0.8, 1.2)
+
+    async def _run(self):
+        await asyncio.sleep(random.uniform(0, 2))  # warm the moods right after startup
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:  # never let the loop die
+                print("prefetch pass failed:", e)
+            await asyncio.sleep(self._delay())
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the flock for the next worker
+            self._lock_file = None
+
+
+prefetcher = Prefetcher()
+
+
+@register_collector
+def _gauges():
+    return [("musicagent_prefetch_targets", "Tag pools the prefetcher keeps warm.", len(prefetcher.targets()))]
@@ -0,0 +1,84 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Opt-in sampling profiler for slow assist() calls. PROFILE_SLOW_MS=0 (the default) turns it off.
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))          # keep profiles of requests slower than this
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))  # fraction of requests that get sampled
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper thread.
+
+    The target is the event-loop thread, so samples cover everything the loop
+    runs while the request is open, not just this request's coroutine; that is
+    usually what you want when asking why a request was slow. Output is in
+    collapsed-stack format ("a;b;c 12"), ready for flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: int | None = None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples: Counter[tuple[str, ...]] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.samples.most_common())
+
+
+_active = False  # one sampler at a time keeps the overhead bounded
+
+
+@contextmanager
+def profile_if_slow(label: str, slow_ms: float = PROFILE_SLOW_MS, sample_rate: float = PROFILE_SAMPLE_RATE):
+    """
+    Sample the enclosed block (for a random `sample_rate` of calls) and write
+    PROFILE_DIR/<time>-<label>.folded if it took at least `slow_ms`.
+    Yields the path that will be written, or None when not sampling.
+    """
+    global _active
+    if slow_ms <= 0 or _active or random.random() >= sample_rate:
+        yield None
+        return
+    _active = True
+    sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label}.folded")
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        yield path
+    finally:
+        sampler.stop()
+        _active = False
+        if (time.perf_counter() - started) * 1000 >= slow_ms and sampler.samples:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(sampler.collapsed())
@@ -0,0 +1,184 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+from metrics import LASTFM_LIMITER_WAIT
+from store import connect
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, holding at most `burst`.
+
+    acquire() reserves a token up front and sleeps until it is due, so waiters
+    are served in arrival order without a lock. If the wait would exceed
+    `timeout` the reservation is handed back and TimeoutError is raised.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self.acquired = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.rejected = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def available(self) -> float:
+        """Tokens that could be taken right now without waiting (negative = queue backlog)."""
+        self._refill(time.monotonic())
+        return self._tokens
+
+    async def acquire(self, timeout: float | None = None) -> float:
+        """Take one token; returns the seconds spent waiting for it."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        self._tokens -= 1
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if timeout is not None and wait > timeout:
+            self._tokens += 1
+            self.rejected += 1
+            raise TimeoutError(f"rate limiter wait {wait:.2f}s exceeds budget {timeout:.2f}s")
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._tokens += 1
+                raise
+            self.waited += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        self.acquired += 1
+        LASTFM_LIMITER_WAIT.observe(wait)
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "wait_seconds_total": round(self.wait_total, 6),
+            "wait_seconds_max": round(self.wait_max, 6),
+            "rejected": self.rejected,
+        }
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose tokens live in a SQLite file, so several worker processes share one budget.
+
+    Same reserve-then-sleep scheme as TokenBucket; each reservation is one
+    short BEGIN IMMEDIATE transaction on a single row, run on a worker
+    thread since it can wait up to busy_timeout on another worker's lock.
+    A waiter cancelled mid-reservation or mid-sleep hands its token back.
+    available() runs on the event loop, so it reads through its own
+    connection with no busy wait and never touches the writer's lock; if
+    the row can't be read right away it answers from the last reservation.
+    Wall clock time is used since the row is read by other processes.
+    """
+
+    def __init__(self, path: str, rate: float, burst: int, name: str = "lastfm"):
+        super().__init__(rate, burst)
+        self.path = path
+        self.name = name
+        self._conn = None
+        self._lock = threading.Lock()
+        self._reader = None
+        self._read_lock = threading.Lock()  # only ever held for one non-blocking SELECT
+        self._last: tuple[float, float] | None = None  # (tokens, updated) as of our last write
+
+    def _db(self):
+        if self._conn is None:
+            conn = connect(self.path)
+            conn.execute("CREATE TABLE IF NOT EXISTS limiter (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def _take(self, n: float, timeout: float | None = None) -> float | None:
+        """Take n tokens after refilling and return what is left; None (nothing taken) if the wait would pass timeout."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = db.execute("SELECT tokens, updated FROM limiter WHERE name = ?", (self.name,)).fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+                tokens -= n
+                if timeout is not None and tokens < 0 and -tokens / self.rate > timeout:
+                    db.execute("ROLLBACK")
+                    return None
+                db.execute("INSERT OR REPLACE INTO limiter (name, tokens, updated) VALUES (?, ?, ?)",
+                           (self.name, tokens, now))
+                db.execute("COMMIT")
+                self._last = (tokens, now)
+                return tokens
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def available(self) -> float:
+        if self.rate <= 0:
+            return float(self.burst)
+        try:
+            with self._read_lock:
+                if self._reader is None:
+                    self._reader = sqlite3.connect(self.path, timeout=0, isolation_level=None, check_same_thread=False)
+                row = self._reader.execute("SELECT tokens, updated FROM limiter WHERE name = ?", (self.name,)).fetchone()
+        except sqlite3.Error:
+            row = self._last  # busy, or no table yet
+        if row is None:
+            return float(self.burst)
+        return min(self.burst, row[0] + max(0.0, time.time() - row[1]) * self.rate)
+
+    def _refund(self):
+        # fire and forget: the caller is being cancelled and shouldn't wait on the lock again
+        asyncio.get_running_loop().run_in_executor(None, self._take, -1)
+
+    def _refund_when_done(self, fut: asyncio.Future):
+        if not fut.cancelled() and fut.exception() is None and fut.result() is not None:
+            self._refund()
+
+    async def acquire(self, timeout: float | None = None) -> float:
+        if self.rate <= 0:
+            return 0.0
+        take = asyncio.ensure_future(asyncio.to_thread(self._take, 1, timeout))
+        try:
+            tokens = await asyncio.shield(take)
+        except asyncio.CancelledError:
+            take.add_done_callback(self._refund_when_done)  # the thread still finishes its transaction
+            raise
+        if tokens is None:
+            self.rejected += 1
+            raise TimeoutError(f"rate limiter wait exceeds budget {timeout:.2f}s")
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._refund()
+                raise
+            self.waited += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        self.acquired += 1
+        LASTFM_LIMITER_WAIT.observe(wait)
+        return wait
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        with self._read_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
@@ -0,0 +1,99 @@
+class SSEEvent:
+    __slots__ = ("event", "data", "id", "retry")
+
+    def __init__(self, event: str, data: str, id: str, retry: int | None):
+        self.event = event
+        self.data = data
+        self.id = id
+        self.retry = retry
+
+    def __repr__(self):
+        return f"SSEEvent(event={self.event!r}, data={self.data[:60]!r}, id={self.id!r})"
+
+
+class SSEDecoder:
+    """
+    Incremental text/event-stream decoder that works on raw byte chunks.
+
+    feed() takes bytes exactly as they come off the socket (chunk boundaries
+    can fall anywhere, including inside a CRLF or a UTF-8 sequence) and
+    returns the events completed by that chunk. Follows the WHATWG parsing
+    rules: CR, LF and CRLF line endings, multi-line `data:` joined with
+    "\n", comments, `id:` (sticky across events) and `retry:`.
+    """
+
+    def __init__(self):
+        self._buf = b""
+        self._skip_lf = False  # last chunk ended in CR; a leading LF belongs to it
+        self._event = ""
+        self._data: list[bytes] = []
+        self.last_event_id = ""
+        self.retry: int | None = None
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        if self._skip_lf and chunk:
+            self._skip_lf = False
+            if chunk[:1] == b"\n":
+                chunk = chunk[1:]
+        buf = self._buf + chunk if self._buf else chunk
+        if not buf:
+            return []
+        lines = buf.splitlines(keepends=True)
+        last = lines[-1]
+        if last[-1:] in (b"\n", b"\r"):
+            self._buf = b""
+            self._skip_lf = last[-1:] == b"\r"
+        else:
+            self._buf = lines.pop()
+        events = []
+        for line in lines:
+            line = line.rstrip(b"\r\n")
+            if line[:5] == b"data:":  # fast path: the bulk of every stream
+                self._data.append(line[6:] if line[5:6] == b" " else line[5:])
+                continue
+            ev = self._line(line)
+            if ev is not None:
+                events.append(ev)
+        return events
+
+    def flush(self) -> list[SSEEvent]:
+        """End of stream: finish a trailing line and dispatch whatever is pending."""
+        events = []
+        if self._buf:
+            ev = self._line(self._buf)
+            self._buf = b""
+            if ev is not None:
+                events.append(ev)
+        ev = self._dispatch()
+        if ev is not None:
+            events.append(ev)
+        return events
+
+    def _line(self, line: bytes) -> SSEEvent | None:
+        if not line:
+            return self._dispatch()
+        if line[0] == 0x3A:  # ":" comment / keep-alive
+            return None
+        field, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+        if field == b"data":
+            self._data.append(value)
+        elif field == b"event":
+            self._event = value.decode("utf-8", "replace")
+        elif field == b"id":
+            if b"\0" not in value:
+                self.last_event_id = value.decode("utf-8", "replace")
+        elif field == b"retry":
+            if value.isdigit():
+                self.retry = int(value)
+        return None
+
+    def _dispatch(self) -> SSEEvent | None:
+        data, event = self._data, self._event
+        self._event = ""
+        if not data:
+            return None
+        self._data = []
+        payload = data[0] if len(data) == 1 else b"\n".join(data)
+        return SSEEvent(event or "message", payload.decode("utf-8", "replace"), self.last_event_id, self.retry)
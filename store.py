@@ -0,0 +1,115 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """SQLite connection set up for several processes sharing one file (WAL, autocommit)."""
+    conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class PoolStore:
+    """
+    Persistent key → JSON store backed by one SQLite file in WAL mode.
+
+    Used for normalized Last.fm pools so a restarted agent doesn't start cold.
+    Several worker processes on one host can share the file: WAL lets readers
+    run alongside the single writer and busy_timeout serializes writers.
+
+    Nothing is read up front; the connection opens on first use and each
+    lookup is a single primary-key read. Every `compact_every` writes the
+    expired rows are dropped and the table is trimmed to `max_rows`, oldest
+    writes first.
+    """
+
+    def __init__(self, path: str, max_rows: int = 50_000, compact_every: int = 500):
+        self.path = path
+        self.max_rows = max_rows
+        self.compact_every = compact_every
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = connect(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pools ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires REAL NOT NULL, written REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS pools_expires ON pools(expires)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pools_written ON pools(written)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str):
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> tuple | None:
+        """(value, seconds until it expires, size in bytes) for a live row; None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._db().execute(
+                "SELECT value, expires FROM pools WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0]), row[1] - now, len(row[0])
+
+    def put(self, key: str, value, ttl: float):
+        now = time.time()
+        blob = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO pools (key, value, expires, written) VALUES (?, ?, ?, ?)",
+                (key, blob, now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % self.compact_every == 0:
+                self._compact(now)
+
+    def _compact(self, now: float):
+        db = self._db()
+        db.execute("DELETE FROM pools WHERE expires <= ?", (now,))
+        db.execute(
+            "DELETE FROM pools WHERE key IN ("
+            " SELECT key FROM pools ORDER BY written DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+        db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        self.compactions += 1
+
+    def compact(self):
+        with self._lock:
+            self._compact(time.time())
+
+    async def aget(self, key: str):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aget_entry(self, key: str) -> tuple | None:
+        return await asyncio.to_thread(self.get_entry, key)
+
+    async def aput(self, key: str, value, ttl: float):
+        await asyncio.to_thread(self.put, key, value, ttl)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "writes": self._writes, "compactions": self.compactions}
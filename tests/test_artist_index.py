@@ -0,0 +1,48 @@
+from artist_index import ArtistIndex
+
+NAMES = ["Arctic Monkeys", "Beyoncé", "Daft Punk", "The Weeknd", "Kendrick Lamar", "Drake Bell", "Queen"]
+
+
+def _index(**kw) -> ArtistIndex:
+    idx = ArtistIndex(**kw)
+    idx.add_many(NAMES)
+    return idx
+
+
+def test_exact_match_after_normalization():
+    idx = _index()
+    assert idx.lookup("beyonce!") == "Beyoncé"
+    assert idx.lookup("  ARCTIC   monkeys ") == "Arctic Monkeys"
+    assert idx.stats()["exact_hits"] == 2
+
+
+def test_misspelling():
+    idx = _index()
+    assert idx.lookup("artic monkeys") == "Arctic Monkeys"
+    assert idx.lookup("daft pnk") == "Daft Punk"
+    assert idx.lookup("the weekend") == "The Weeknd"
+    assert idx.lookup("kendrik lamar") == "Kendrick Lamar"
+
+
+def test_prefix_or_extra_words_are_not_a_match():
+    idx = _index()
+    assert idx.lookup("drake") is None  # not Drake Bell
+    assert idx.lookup("queens") is None  # not Queen
+    assert idx.lookup("monkeys") is None
+    assert idx.lookup("kendrick lamar live") is None
+
+
+def test_unrelated_name_misses():
+    assert _index().lookup("Taylor Swift") is None
+
+
+def test_least_recently_used_names_are_evicted():
+    idx = ArtistIndex(max_names=3)
+    idx.add_many(["Daft Punk", "Queen", "Arctic Monkeys"])
+    assert idx.lookup("daft punk") == "Daft Punk"  # now the most recently used
+    idx.add("The Weeknd")
+    assert len(idx) == 3
+    assert idx.stats()["evictions"] == 1
+    assert idx.lookup("queen") is None
+    assert idx.lookup("artic monkeys") == "Arctic Monkeys"
+    assert idx.lookup("daft punk") == "Daft Punk"
@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+
+import budget
+import lastfm
+from metrics import LASTFM_RETRIES_TOTAL
+from ratelimit import TokenBucket
+from store import PoolStore
+
+JAZZ = {"tracks": {"track": [{"name": "So What", "artist": {"name": "Miles Davis"}}]}}
+
+
+def _offline(monkeypatch):
+    monkeypatch.setattr(lastfm, "LASTFM_API_KEY", "test")
+    monkeypatch.setattr(lastfm, "LASTFM_BACKOFF_BASE", 0)
+    monkeypatch.setattr(lastfm, "_limiter", TokenBucket(0, 1))
+    monkeypatch.setattr(lastfm, "_store", None)
+    lastfm._cache.clear()
+    lastfm._pools.clear()
+
+
+def test_transient_error_is_retried(monkeypatch):
+    _offline(monkeypatch)
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(503, json={"error": 16, "message": "try again"})
+        return httpx.Response(200, json=JAZZ)
+
+    async def run():
+        await lastfm.startup(transport=httpx.MockTransport(handler))
+        try:
+            return await lastfm._get_json({"method": "tag.gettoptracks", "tag": "jazz", "limit": 40})
+        finally:
+            await lastfm.shutdown()
+
+    before = LASTFM_RETRIES_TOTAL.snapshot().get(("tag.gettoptracks",), 0)
+    assert asyncio.run(run()) == JAZZ
+    assert len(calls) == 2
+    assert LASTFM_RETRIES_TOTAL.snapshot()[("tag.gettoptracks",)] == before + 1
+
+
+def test_store_hit_is_kept_in_memory(monkeypatch, tmp_path):
+    _offline(monkeypatch)
+    store = PoolStore(str(tmp_path / "pools.db"))
+    monkeypatch.setattr(lastfm, "_store", store)
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json=JAZZ)
+
+    async def run():
+        await lastfm.startup(transport=httpx.MockTransport(handler))
+        try:
+            first = await lastfm.tag_pool("jazz")
+            lastfm._cache.clear()  # as if the worker restarted
+            return first, [await lastfm.tag_pool("jazz") for _ in range(5)]
+        finally:
+            await lastfm.shutdown()
+
+    first, again = asyncio.run(run())
+    assert again == [first] * 5
+    assert len(calls) == 1
+    assert store.stats()["hits"] == 1
+
+
+def test_expired_entry_serves_every_caller_when_budget_runs_out(monkeypatch):
+    _offline(monkeypatch)
+    params = {"method": "tag.gettoptracks", "tag": "jazz", "limit": "40"}
+    lastfm._cache.set(lastfm._cache_key(params), JAZZ, ttl=0)  # past its stale window already
+
+    async def slow(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(1)
+        return httpx.Response(200, json=JAZZ)
+
+    async def call():
+        with budget.scope(0.05):
+            return await lastfm._get_json(params)
+
+    async def run():
+        await lastfm.startup(transport=httpx.MockTransport(slow))
+        try:
+            return await asyncio.gather(call(), call(), call()), await call()
+        finally:
+            await lastfm.shutdown()
+
+    together, later = asyncio.run(run())
+    assert together == [JAZZ] * 3
+    assert later == JAZZ
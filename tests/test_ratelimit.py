@@ -0,0 +1,46 @@
+import asyncio
+import threading
+import time
+
+from ratelimit import SharedTokenBucket
+from store import connect
+
+
+def test_shared_bucket_refunds_cancelled_waiters(tmp_path):
+    bucket = SharedTokenBucket(str(tmp_path / "state.db"), rate=1, burst=2)
+
+    async def run():
+        await bucket.acquire()
+        await bucket.acquire()
+        waiters = [asyncio.create_task(bucket.acquire()) for _ in range(3)]
+        await asyncio.sleep(0.2)  # all three have reserved and are sleeping
+        for t in waiters:
+            t.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.2)  # refunds run on worker threads
+
+    asyncio.run(run())
+    assert -0.1 < bucket.available() < 1
+    # available() only reads the row
+    before = bucket._db().execute("SELECT tokens, updated FROM limiter").fetchone()
+    bucket.available()
+    assert bucket._db().execute("SELECT tokens, updated FROM limiter").fetchone() == before
+    bucket.close()
+
+
+def test_shared_bucket_available_does_not_wait_for_writers(tmp_path):
+    path = str(tmp_path / "state.db")
+    bucket = SharedTokenBucket(path, rate=5, burst=10)
+    asyncio.run(bucket.acquire())
+    other = connect(path)
+    other.execute("BEGIN IMMEDIATE")  # another worker holds the write lock...
+    writer = threading.Thread(target=bucket._take, args=(1,))
+    writer.start()  # ...and our own reservation is stuck behind it, holding bucket._lock
+    time.sleep(0.1)
+    started = time.perf_counter()
+    assert bucket.available() > 0
+    assert time.perf_counter() - started < 0.5
+    other.execute("ROLLBACK")
+    writer.join()
+    other.close()
+    bucket.close()
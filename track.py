@@ -0,0 +1,48 @@
+from functools import lru_cache
+from urllib.parse import quote_plus
+
+
+@lru_cache(maxsize=8192)
+def youtube_link(artist: str, title: str) -> str:
+    # memoized: cached pools hand out the same popular tracks over and over
+    return f"https://www.youtube.com/results?search_query={quote_plus((artist + ' ' + title).strip())}"
+
+
+class Track:
+    """
+    One recommended track: just the artist and title, the YouTube link is built on demand.
+
+    Serializes to the usual {"artist", "title", "youtube"} dict with to_dict().
+    t["artist"] / t["title"] / t["youtube"] also work, so code written
+    against the old dicts keeps working.
+    """
+
+    __slots__ = ("artist", "title")
+    _fields = ("artist", "title", "youtube")
+
+    def __init__(self, artist: str, title: str):
+        self.artist = artist
+        self.title = title
+
+    @property
+    def youtube(self) -> str:
+        return youtube_link(self.artist, self.title)
+
+    def to_dict(self) -> dict:
+        return {"artist": self.artist, "title": self.title, "youtube": self.youtube}
+
+    def __getitem__(self, key: str):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if not isinstance(other, Track):
+            return NotImplemented
+        return self.artist == other.artist and self.title == other.title
+
+    def __hash__(self):
+        return hash((self.artist, self.title))
+
+    def __repr__(self):
+        return f"Track({self.artist!r}, {self.title!r})"